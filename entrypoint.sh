@@ -10,6 +10,9 @@ fi
 # Run migrations
 python "$PWD"/manage.py migrate
 
+# Precompute the OpenAPI schema of this release
+python "$PWD"/manage.py generate_schema
+
 
 # Run server
 if [ "$DEPLOYMENT_ARCHITECTURE" = "local" ]; then
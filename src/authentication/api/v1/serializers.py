@@ -2,10 +2,12 @@ from django.contrib.auth import get_user_model, password_validation
 from django.contrib.auth.base_user import BaseUserManager
 from rest_framework import serializers
 
+from server.serializers import SparseFieldsSerializerMixin
+
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -32,7 +34,9 @@ class LoginSerializer(serializers.Serializer):  # noqa
     password = serializers.CharField(required=True)
 
 
-class UserRegisterSerializer(serializers.ModelSerializer):
+class UserRegisterSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
     """
     A user serializer for registering the user
     """
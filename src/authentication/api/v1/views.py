@@ -23,6 +23,7 @@ from authentication.api.v1.serializers import (
     UserRegisterSerializer,
     UserSerializer,
 )
+from authentication.backends import token_cache
 from authentication.emails import send_activation_email
 
 User = get_user_model()
@@ -54,7 +55,10 @@ class AuthViewSet(viewsets.GenericViewSet):
         Returns:
             response: Response
         """
-        user_serializer = UserSerializer(request.user)
+        user_serializer = UserSerializer(
+            request.user,
+            context=self.get_serializer_context(),
+        )
 
         return Response(
             data=user_serializer.data,
@@ -97,7 +101,10 @@ class AuthViewSet(viewsets.GenericViewSet):
             raise serializers.ValidationError(
                 "Invalid username/password. Please try again!"
             )
-        user_serializer = UserSerializer(user)
+        user_serializer = UserSerializer(
+            user,
+            context=self.get_serializer_context(),
+        )
 
         return Response(data=user_serializer.data, status=status.HTTP_200_OK)
 
@@ -116,7 +123,7 @@ class AuthViewSet(viewsets.GenericViewSet):
     def logout(self, request):
         """Calls Django logout method;
 
-        Does not work for UserTokenAuth.
+        Does not work for UserTokenAuth, only the cached token is dropped.
 
         Args:
             request: Django Request Instance
@@ -125,6 +132,8 @@ class AuthViewSet(viewsets.GenericViewSet):
             response: Response
         """
         logout(request)
+        if isinstance(request.auth, Token):
+            token_cache.delete_many((request.auth.key,))
 
         success_serializer = SuccessSerializer(
             instance={
@@ -189,7 +198,10 @@ class AuthViewSet(viewsets.GenericViewSet):
             **serializer.validated_data,
             is_active=False,
         )
-        user_serializer = UserSerializer(user)
+        user_serializer = UserSerializer(
+            user,
+            context=self.get_serializer_context(),
+        )
 
         params = {
             "user_id_b64": urlsafe_base64_encode(force_bytes(user.pk)),
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AuthenticationConfig(AppConfig):
     name = "authentication"
+
+    def ready(self):
+        import authentication.signals  # noqa
+
+        # Database may be recreated, e.g. by tests, with reused ids
+        post_migrate.connect(
+            authentication.signals.clear_token_cache, sender=self
+        )
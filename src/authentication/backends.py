@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from server.cache import TwoLevelCache
+
+User = get_user_model()
+
+
+class TokenCache(TwoLevelCache):
+    """
+    Cache of the auth tokens with their users, keyed by the token key
+
+    Only the columns of the user which requests read are cached, never
+    the password hash. Tokens and users are rebuilt from them with the
+    rest of the columns deferred.
+    """
+
+    key_prefix = "token"
+    user_fields = (
+        "id",
+        "username",
+        "email",
+        "first_name",
+        "last_name",
+        "last_login",
+        "is_active",
+    )
+
+    def invalidate_user(self, user_id):
+        self.delete_many(
+            Token.objects.filter(user=user_id).values_list("key", flat=True)
+        )
+
+    def get(self, ident):
+        data = super().get(ident)
+        if data is None:
+            return None
+
+        user = build_instance(User, data["user"])
+        token = build_instance(
+            Token,
+            {"key": ident, "user_id": user.id, "created": data["created"]},
+        )
+        user.auth_token = token
+        return token
+
+    def load(self, key):
+        row = (
+            Token.objects.filter(key=key)
+            .values_list(
+                "created", *(f"user__{name}" for name in self.user_fields)
+            )
+            .first()
+        )
+        if row is None:
+            return None
+
+        created, *values = row
+        return {
+            "created": created,
+            "user": dict(zip(self.user_fields, values)),
+        }
+
+
+def build_instance(model, values):
+    """Model instance loaded with some of the columns only
+
+    Args:
+        model: model class
+        values: values by attribute name of the fields
+
+    Returns:
+        Model: instance with the other columns deferred
+    """
+    names = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname in values
+    ]
+    return model.from_db(
+        router.db_for_read(model), names, [values[name] for name in names]
+    )
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE)
+
+
+def get_token(key):
+    """Active token by its key
+
+    Args:
+        key: key of the token
+
+    Returns:
+        Token: token with the user or None if it's invalid or inactive
+    """
+    token = token_cache.get(key)
+    if token is None or not token.user.is_active:
+        return None
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication served by the token cache
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            raise AuthenticationFailed(_("Invalid token."))
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+
+        return token.user, token
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from authentication.backends import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):  # noqa
+    """Forget cached tokens of a changed user
+
+    Covers password changes and deactivation, both save the user.
+
+    Args:
+        sender: sender of the signal
+        instance: instance of the model
+        kwargs: additional arguments
+    """
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):  # noqa
+    """Forget a deleted token
+
+    Args:
+        sender: sender of the signal
+        instance: instance of the model
+        kwargs: additional arguments
+    """
+    token_cache.delete_many((instance.key,))
+
+
+def clear_token_cache(sender, **kwargs):  # noqa
+    """Drop all cached tokens after the migrations
+
+    Args:
+        sender: sender of the signal
+        kwargs: additional arguments
+    """
+    token_cache.clear()
@@ -6,6 +6,7 @@ from django.utils.http import urlsafe_base64_encode
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
+from authentication.backends import token_cache
 from authentication.tests.factory import UserFactory
 
 
@@ -34,6 +35,18 @@ class AddUserViewTest(APITestCase):
         )
         self.assertEqual(response.data["id"], self.user.id)
 
+    def test_user_with_sparse_fields(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+        response = self.client.post(
+            f'{reverse("authentication:auth-user")}?fields=id,username',
+        )
+        self.assertDictEqual(
+            response.data,
+            {"id": self.user.id, "username": self.user.username},
+        )
+
     @mock.patch("authentication.api.v1.views.send_activation_email")
     def test_user_register_without_activate_url(self, send_mail_mocked):
         response = self.client.post(
@@ -88,3 +101,59 @@ class AddUserViewTest(APITestCase):
                 "token": self.user.auth_token.key,
             },
         )
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def get_user(self):
+        return self.client.post(reverse("authentication:auth-user"))
+
+    def test_token_is_cached(self):
+        self.assertEqual(self.get_user().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.get_user()
+        self.assertEqual(response.data["id"], self.user.id)
+
+    def test_password_is_not_cached(self):
+        self.get_user()
+        data = token_cache.cache.get(
+            token_cache.make_key(self.user.auth_token.key)
+        )
+        self.assertEqual(data["user"]["id"], self.user.id)
+        self.assertNotIn("password", data["user"])
+
+    def test_deactivated_user(self):
+        self.get_user()
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.get_user().status_code, 401)
+
+    def test_password_change(self):
+        self.get_user()
+        response = self.client.post(
+            reverse("authentication:auth-password-change"),
+            data={"current_password": "password", "new_password": "1234567!"},
+        )
+        self.assertEqual(response.status_code, 204)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_user().status_code, 200)
+
+    def test_deleted_token(self):
+        self.get_user()
+        self.user.auth_token.delete()
+
+        self.assertEqual(self.get_user().status_code, 401)
+
+    def test_logout(self):
+        self.get_user()
+        self.client.post(reverse("authentication:auth-logout"))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_user().status_code, 200)
@@ -0,0 +1,337 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+from messenger.api.v1.serializers import UserSerializer
+from server.cache import get_or_compute
+from server.serializers import get_nested_render_keys, is_sparse
+
+User = get_user_model()
+
+
+def index_by_id(data):
+    return {item["id"]: item for item in data}
+
+
+def get_chat_users(chats):
+    """Collect users of the chats, taking invited ones from the prefetch
+
+    Args:
+        chats: chat instances with prefetched invited users
+
+    Returns:
+        tuple: loaded users by id and ids of all users of the chats
+    """
+    users, user_ids = {}, {}
+    for chat in chats:
+        user_ids[chat.creator_id] = None
+        for user in chat.invited.all():
+            users[user.id] = user
+            user_ids[user.id] = None
+    return users, user_ids
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Mixin to answer `304 Not Modified` to clients with a fresh copy
+
+    Validators are computed from the ids and `updated_at` of the objects
+    the response renders and the render versions of their nested objects,
+    so they're taken from the loaded page or object and a polling client
+    with a matching `If-None-Match` gets the answer before anything is
+    serialized.
+    """
+
+    conditional_actions = ("list", "retrieve")
+    conditional_field = "updated_at"
+
+    def is_conditional(self):
+        return self.request.method == "GET" and (
+            self.action in self.conditional_actions
+        )
+
+    def get_validators(self, instances):
+        """Compute ETag and Last-Modified of the rendered objects
+
+        Args:
+            instances: objects of the page or the requested object
+
+        Returns:
+            tuple: ETag and Last-Modified datetime or None
+        """
+        versions = [
+            (instance.pk, getattr(instance, self.conditional_field))
+            for instance in instances
+        ]
+        # Renamed users or chats don't touch the objects they're rendered in
+        nested_keys = get_nested_render_keys(self.get_serializer(), instances)
+        key = "|".join(
+            (
+                self.request.get_full_path(),
+                str(self.request.user.pk),
+                # Totals of the page change with objects of other pages
+                str(getattr(self.paginator, "count", None)),
+                *(f"{pk}@{version.isoformat()}" for pk, version in versions),
+                *nested_keys,
+            )
+        )
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+        # Deleted objects don't change the newest `updated_at` of a list
+        # and nested objects aren't dated, so only a single object without
+        # them can be validated by the date
+        if self.detail and not nested_keys:
+            return etag, versions[0][1]
+        return etag, None
+
+    def check_not_modified(self, instances):
+        """Remember validators of the response and answer 304 if they match
+
+        Args:
+            instances: objects of the page or the requested object
+
+        Raises:
+            NotModified: the client has a fresh copy
+        """
+        self.validators = self.get_validators(instances)
+        etag, last_modified = self.validators
+        response = get_conditional_response(
+            self.request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp()),
+        )
+        if response is not None:
+            raise NotModified(response)
+
+    def get_columns(self, model, fields):
+        columns = super().get_columns(model, fields)
+        columns.add(self.conditional_field)
+        return columns
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.is_conditional():
+            self.check_not_modified(page)
+        return page
+
+    def get_object(self):
+        instance = super().get_object()
+        if self.is_conditional():
+            self.check_not_modified((instance,))
+        return instance
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+
+        validators = getattr(self, "validators", None)
+        if validators is None or response.status_code not in (200, 304):
+            return response
+
+        etag, last_modified = validators
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+
+class CachedListMixin:
+    """
+    Mixin to serve list pages from the shared cache
+
+    Pages are computed by a single request at a time and refreshed a bit
+    before they expire, so a popular page doesn't hit the database with
+    every request which comes in while it's missing.
+    """
+
+    list_cache_timeout = 60
+
+    def get_list_cache_key(self):
+        """Key of the requested page
+
+        Returns:
+            str: key unique for the user and the query
+        """
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return f"{self.basename}-list:{self.request.user.pk}:{path}"
+
+    def list(self, request, *args, **kwargs):
+        parent_list = super().list
+        data = get_or_compute(
+            self.get_list_cache_key(),
+            lambda: parent_list(request, *args, **kwargs).data,
+            timeout=self.list_cache_timeout,
+        )
+        return Response(data)
+
+
+class SideloadMixin:
+    """
+    Mixin to render list pages in the normalized shape
+
+    With `?include=users,chats` the results reference related objects by id
+    and every distinct related object is rendered once under `included`.
+    """
+
+    include_query_param = "include"
+    sideloads = ()
+    sideload_serializer_class = None
+
+    def get_includes(self):
+        value = self.request.query_params.get(self.include_query_param, "")
+        return {name for name in value.split(",") if name in self.sideloads}
+
+    def get_included(self, instances, includes):
+        """Render related objects of the page
+
+        Args:
+            instances: objects of the page
+            includes: names of the requested related objects
+
+        Raises:
+            NotImplementedError: must be implemented by the viewset
+        """
+        raise NotImplementedError
+
+    def get_included_users(self, users, user_ids):
+        """Render users once, loading the ones which weren't prefetched
+
+        Args:
+            users: already loaded users by id
+            user_ids: ids of all users to render
+
+        Returns:
+            dict: rendered users by id
+        """
+        missing = set(user_ids) - set(users)
+        if missing:
+            users.update(
+                (user.id, user) for user in User.objects.filter(pk__in=missing)
+            )
+        return index_by_id(
+            UserSerializer(
+                (users[user_id] for user_id in user_ids if user_id in users),
+                many=True,
+            ).data
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action != "list" or not self.get_includes():
+            return super().get_serializer(*args, **kwargs)
+
+        kwargs.setdefault("context", self.get_serializer_context())
+        return self.sideload_serializer_class(*args, **kwargs)
+
+    @swagger_auto_schema(
+        manual_parameters=(
+            openapi.Parameter(
+                name="include",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Comma separated related objects to side-load",
+            ),
+        ),
+    )
+    def list(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        if not includes:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        instances = list(queryset) if page is None else page
+
+        serializer = self.get_serializer(instances, many=True)
+        if page is None:
+            response = Response({"results": serializer.data})
+        else:
+            response = self.get_paginated_response(serializer.data)
+
+        response.data["included"] = self.get_included(instances, includes)
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    Mixin to load only the relations and columns the response renders
+
+    Prefetches are picked from `field_prefetches` by the nested fields left
+    in the serializer, and with `?fields=`/`?exclude=` the unused columns
+    are deferred as well.
+    """
+
+    field_prefetches = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        fields = self.get_serializer().fields
+        queryset = queryset.prefetch_related(None).prefetch_related(
+            *(
+                lookup
+                for name, field in fields.items()
+                if not isinstance(field, PrimaryKeyRelatedField)
+                for lookup in self.field_prefetches.get(name, ())
+            )
+        )
+
+        if is_sparse(self.request):
+            queryset = queryset.only(
+                *self.get_columns(queryset.model, fields.values())
+            )
+        return queryset
+
+    def get_columns(self, model, fields):
+        """Collect the columns which have to be loaded for the fields
+
+        Args:
+            model: model of the queryset
+            fields: serializer fields
+
+        Returns:
+            set: names of the model fields
+        """
+        columns = {"id"}
+        columns.update(getattr(self.paginator, "ordering", ()))
+
+        for field in fields:
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+
+        return {column.lstrip("-") for column in columns}
@@ -1,16 +1,48 @@
 from django.contrib.auth import get_user_model
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 from rest_framework.fields import ChoiceField
 
 from messenger.choices import STATUS
-from messenger.models import Chat, File, Message
+from messenger.models import Chat, File, Membership, Message
+from server.serializers import (
+    RenderCacheListSerializer,
+    RenderCacheSerializerMixin,
+    SparseFieldsSerializerMixin,
+)
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class MemoizedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field which looks up every distinct object only once
+
+    A `many=True` serializer validates all items with the same child
+    fields, so a batch referencing one chat loads it once.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.memo = {}
+
+    def to_internal_value(self, data):
+        key = str(data)
+        if key not in self.memo:
+            self.memo[key] = super().to_internal_value(data)
+        return self.memo[key]
+
+
+class UserSerializer(
+    RenderCacheSerializerMixin,
+    SparseFieldsSerializerMixin,
+    serializers.ModelSerializer,
+):
+    render_key_prefix = "messenger-user"
+
     class Meta:
         ref_name = "MessengerUserSerializer"
+        list_serializer_class = RenderCacheListSerializer
         model = User
         fields = (
             "id",
@@ -22,7 +54,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
 
-class ChatSerializer(serializers.ModelSerializer):
+class ChatSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Chat
         fields = (
@@ -36,11 +68,18 @@ class ChatSerializer(serializers.ModelSerializer):
         )
 
 
-class ChatViewSerializer(serializers.ModelSerializer):
+class ChatViewSerializer(
+    RenderCacheSerializerMixin,
+    SparseFieldsSerializerMixin,
+    serializers.ModelSerializer,
+):
+    render_key_prefix = "chat"
+
     creator = UserSerializer()
     invited = UserSerializer(many=True)
 
     class Meta:
+        list_serializer_class = RenderCacheListSerializer
         model = Chat
         fields = (
             "id",
@@ -53,7 +92,57 @@ class ChatViewSerializer(serializers.ModelSerializer):
         )
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class LastMessageSerializer(serializers.Serializer):  # noqa
+    id = serializers.IntegerField()
+    text = serializers.CharField()
+    sender = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+
+
+class ChatInboxSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Chat with a preview of its latest message and the unread count
+    """
+
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField()
+    last_activity_at = serializers.DateTimeField()
+
+    class Meta:
+        model = Chat
+        fields = (
+            "id",
+            "title",
+            "creator",
+            "is_closed",
+            "created_at",
+            "last_message",
+            "unread_count",
+            "last_activity_at",
+        )
+
+    @swagger_serializer_method(serializer_or_field=LastMessageSerializer)
+    def get_last_message(self, chat):
+        message = getattr(chat, "last_message", None)
+        if message is None:
+            return None
+        return LastMessageSerializer(
+            {
+                "id": message.id,
+                "text": message.preview,
+                "sender": message.sender_id,
+                "created_at": message.created_at,
+            }
+        ).data
+
+
+class MessageSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
+    serializer_related_field = MemoizedPrimaryKeyRelatedField
+
     class Meta:
         model = Message
         fields = (
@@ -67,7 +156,7 @@ class MessageSerializer(serializers.ModelSerializer):
         )
 
 
-class FileSerializer(serializers.ModelSerializer):
+class FileSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = File
         fields = (
@@ -78,13 +167,20 @@ class FileSerializer(serializers.ModelSerializer):
         )
 
 
-class MessageViewSerializer(serializers.ModelSerializer):
+class MessageViewSerializer(
+    RenderCacheSerializerMixin,
+    SparseFieldsSerializerMixin,
+    serializers.ModelSerializer,
+):
+    render_key_prefix = "message"
+
     sender = UserSerializer()
     chat = ChatViewSerializer()
     status = ChoiceField(choices=STATUS.choices)
     file_set = FileSerializer(many=True)
 
     class Meta:
+        list_serializer_class = RenderCacheListSerializer
         model = Message
         fields = (
             "id",
@@ -96,3 +192,71 @@ class MessageViewSerializer(serializers.ModelSerializer):
             "updated_at",
             "file_set",
         )
+
+
+class MessageFlatSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Message with its sender and chat referenced by id
+    """
+
+    status = ChoiceField(choices=STATUS.choices)
+    file_set = FileSerializer(many=True)
+
+    class Meta:
+        model = Message
+        fields = (
+            "id",
+            "sender",
+            "chat",
+            "text",
+            "status",
+            "created_at",
+            "updated_at",
+            "file_set",
+        )
+
+
+class MessageSearchSerializer(MessageFlatSerializer):
+    """
+    Found message with the snippet of its text highlighting the terms
+    """
+
+    highlight = serializers.CharField(read_only=True)
+
+    class Meta(MessageFlatSerializer.Meta):
+        fields = MessageFlatSerializer.Meta.fields + ("highlight",)
+
+
+class MessageSearchQuerySerializer(serializers.Serializer):  # noqa
+    search = serializers.CharField()
+    chat = serializers.IntegerField(min_value=1, required=False)
+
+
+class MessageSendSerializer(serializers.Serializer):  # noqa
+    """
+    Message sent over the websocket, validated without queries
+    """
+
+    client_id = serializers.UUIDField()
+    chat = serializers.IntegerField(min_value=1)
+    text = serializers.CharField()
+
+
+class ReadCursorSerializer(serializers.Serializer):  # noqa
+    message = serializers.IntegerField(min_value=1)
+
+
+class UnreadCountSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
+    unread_count = serializers.IntegerField()
+
+    class Meta:
+        model = Membership
+        fields = (
+            "chat",
+            "last_read_message",
+            "unread_count",
+        )
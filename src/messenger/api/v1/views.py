@@ -1,23 +1,69 @@
+from django.db import transaction
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, mixins, viewsets
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import filters, mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from messenger.api.v1.mixins import (
+    CachedListMixin,
+    ConditionalGetMixin,
+    SideloadMixin,
+    SparseFieldsMixin,
+    get_chat_users,
+    index_by_id,
+)
 from messenger.api.v1.serializers import (
+    ChatInboxSerializer,
     ChatSerializer,
     ChatViewSerializer,
     FileSerializer,
+    MessageFlatSerializer,
+    MessageSearchQuerySerializer,
+    MessageSearchSerializer,
     MessageSerializer,
     MessageViewSerializer,
+    ReadCursorSerializer,
+    UnreadCountSerializer,
+)
+from messenger.cache import membership_cache
+from messenger.indexing import enqueue
+from messenger.managers import member_chats
+from messenger.models import Chat, File, Membership, Message
+from messenger.pagination import (
+    EstimatedCountPagination,
+    KeysetPagination,
+    NoCountPagination,
+    SearchAfterPagination,
 )
-from messenger.models import Chat, File, Message
+from messenger.permissions import IsChatMember
+from messenger.search import FullTextSearchFilter, MessageSearch
+from messenger.websocket.events import get_messages_events, send_events
 
 
-class ChatViewSet(viewsets.ModelViewSet):
+class ChatViewSet(
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    SideloadMixin,
+    viewsets.ModelViewSet,
+):
     """
     API endpoint that allows chats to be viewed or edited.
     """
 
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     ordering = ("-created_at",)
+    pagination_class = EstimatedCountPagination
+    lookup_value_regex = r"\d+"
+    chat_lookup_url_kwarg = "pk"
+    field_prefetches = {
+        "creator": ("creator",),
+        "invited": ("invited",),
+    }
+    sideloads = ("users",)
+    sideload_serializer_class = ChatSerializer
     http_method_names = (
         "get",
         "post",
@@ -27,42 +73,173 @@ class ChatViewSet(viewsets.ModelViewSet):
     )
 
     def get_serializer_class(self):
+        if self.serializer_class is not None:
+            return self.serializer_class
         if self.request.method == "GET":
             return ChatViewSerializer
         return ChatSerializer
 
     def get_queryset(self):
+        # Schema generation has no user to look up the chats
+        if getattr(self, "swagger_fake_view", False):
+            return Chat.objects.none()
         if self.request.method == "GET":
             return Chat.objects.all_mine_and_invited(user=self.request.user)
         return Chat.objects.all_mine(user=self.request.user)
 
+    @swagger_auto_schema(
+        request_body=ReadCursorSerializer,
+        responses={
+            status.HTTP_204_NO_CONTENT: "",
+            status.HTTP_404_NOT_FOUND: "",
+        },
+    )
+    @action(
+        methods=("POST",),
+        detail=True,
+        serializer_class=ReadCursorSerializer,
+        permission_classes=(IsAuthenticated,),
+    )
+    def read(self, request, pk):
+        """Mark messages of the chat as read up to the given one
+
+        Args:
+            request: Django Request Instance
+            pk: Chat ID
+
+        Returns:
+            response: Response
+
+        Raises:
+            NotFound: the user is not a member of the chat
+        """
+        if not membership_cache.is_member(request.user.id, pk):
+            raise NotFound
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        Membership.objects.mark_read(
+            user=request.user,
+            chat_id=pk,
+            message_id=serializer.validated_data["message"],
+        )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        methods=("GET",),
+        detail=False,
+        serializer_class=UnreadCountSerializer,
+        pagination_class=None,
+    )
+    def unread(self, request):
+        """Unread messages count of every chat of the user
+
+        Args:
+            request: Django Request Instance
+
+        Returns:
+            response: Response
+        """
+        memberships = Membership.objects.with_unread_count().filter(
+            user=request.user
+        )
+        serializer = self.get_serializer(memberships, many=True)
 
-class SearchChatViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        methods=("GET",),
+        detail=False,
+        serializer_class=ChatInboxSerializer,
+        pagination_class=NoCountPagination,
+        ordering=("-last_activity_at", "-id"),
+    )
+    def inbox(self, request):
+        """Chats of the user ordered by the last activity
+
+        Every chat comes with a preview of its latest message and the
+        number of unread messages.
+
+        Args:
+            request: Django Request Instance
+
+        Returns:
+            response: Response
+        """
+        queryset = self.filter_queryset(Chat.objects.inbox(user=request.user))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(
+                Chat.objects.attach_last_messages(page), many=True
+            )
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(
+            Chat.objects.attach_last_messages(queryset), many=True
+        )
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+    def get_included(self, instances, includes):
+        return {"users": self.get_included_users(*get_chat_users(instances))}
+
+
+class SearchChatViewSet(
+    SparseFieldsMixin,
+    CachedListMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet,
+):
     """
     API endpoint that allows chats to be viewed or edited.
     """
 
+    # Searching goes last to order by relevance over the default ordering
     filter_backends = (
-        filters.SearchFilter,
         filters.OrderingFilter,
+        FullTextSearchFilter,
     )
     search_fields = ("title",)
     ordering = ("-created_at",)
+    pagination_class = NoCountPagination
+    list_cache_timeout = 30
     http_method_names = ("get",)
     serializer_class = ChatViewSerializer
+    field_prefetches = {
+        "creator": ("creator",),
+        "invited": ("invited",),
+    }
 
     def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return Chat.objects.none()
         return Chat.objects.exclude_mine_and_invited(user=self.request.user)
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    SideloadMixin,
+    viewsets.ModelViewSet,
+):
     """
     API endpoint that allows message to be viewed or edited.
     """
 
-    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    filter_backends = (DjangoFilterBackend,)
     filterset_fields = ("chat",)
-    ordering = ("-created_at",)
+    permission_classes = (IsAuthenticated, IsChatMember)
+    pagination_class = KeysetPagination
+    lookup_value_regex = r"\d+"
+    sideloads = ("users", "chats")
+    sideload_serializer_class = MessageFlatSerializer
+    bulk_max_size = 500
+    field_prefetches = {
+        "sender": ("sender",),
+        "chat": ("chat", "chat__creator", "chat__invited"),
+        "file_set": ("file_set",),
+    }
     http_method_names = (
         "get",
         "post",
@@ -72,15 +249,136 @@ class MessageViewSet(viewsets.ModelViewSet):
     )
 
     def get_serializer_class(self):
+        if self.serializer_class is not None:
+            return self.serializer_class
         if self.request.method == "GET":
             return MessageViewSerializer
         return MessageSerializer
 
     def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return Message.objects.none()
         return Message.objects.all_mine(user=self.request.user)
 
+    def perform_create(self, serializer):
+        # The outbox events are written by the signals after the insert
+        with transaction.atomic():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
+
+    @swagger_auto_schema(
+        request_body=MessageSerializer(many=True),
+        responses={
+            status.HTTP_201_CREATED: MessageSerializer(many=True),
+        },
+    )
+    @action(
+        methods=("POST",),
+        detail=False,
+    )
+    def bulk(self, request):
+        """Create a batch of messages with one insert
+
+        Every affected chat gets a single websocket event with all of its
+        new messages.
+
+        Args:
+            request: Django Request Instance
+
+        Returns:
+            response: Response
+
+        Raises:
+            ValidationError: If the batch is too large
+        """
+        if isinstance(request.data, list) and (
+            len(request.data) > self.bulk_max_size
+        ):
+            raise ValidationError(
+                f"Ensure there are no more than {self.bulk_max_size} messages."
+            )
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            messages = Message.objects.bulk_create(
+                Message(**item) for item in serializer.validated_data
+            )
+            send_events(get_messages_events(messages))
+            # Bulk inserts don't send the signals which queue the indexing
+            enqueue(Message, [message.pk for message in messages])
+
+        return Response(
+            data=self.get_serializer(messages, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @swagger_auto_schema(query_serializer=MessageSearchQuerySerializer)
+    @action(
+        methods=("GET",),
+        detail=False,
+        serializer_class=MessageSearchSerializer,
+        pagination_class=SearchAfterPagination,
+        filter_backends=(),
+    )
+    def search(self, request):
+        """Messages of the user's chats matching the words, newest first
+
+        Words are matched by their prefixes and every message comes with
+        a snippet of its text highlighting them.
+
+        Args:
+            request: Django Request Instance
+
+        Returns:
+            response: Response
+        """
+        query = MessageSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        chat_ids = member_chats(request.user)
+        if "chat" in query.validated_data:
+            chat_ids = chat_ids & {query.validated_data["chat"]}
+        terms = query.validated_data["search"].replace(",", " ").split()
+
+        page = self.paginator.paginate_search(
+            MessageSearch(
+                self.filter_queryset(Message.objects.all()),
+                chat_ids,
+                terms,
+            ),
+            request,
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_included(self, instances, includes):
+        user_ids = dict.fromkeys(message.sender_id for message in instances)
+        users, included = {}, {}
+
+        if "chats" in includes:
+            chats = Chat.objects.filter(
+                pk__in={message.chat_id for message in instances}
+            ).prefetch_related("invited")
+            included["chats"] = index_by_id(
+                ChatSerializer(chats, many=True).data
+            )
+            users, chat_user_ids = get_chat_users(chats)
+            user_ids.update(chat_user_ids)
+
+        if "users" in includes:
+            included["users"] = self.get_included_users(users, user_ids)
+
+        return included
+
 
-class FileViewSet(viewsets.ModelViewSet):
+class FileViewSet(
+    ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet
+):
     """
     API endpoint that allows files to be viewed or edited.
     """
@@ -89,6 +387,8 @@ class FileViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ("message",)
     ordering = ("-created_at",)
+    pagination_class = EstimatedCountPagination
+    lookup_value_regex = r"\d+"
     http_method_names = (
         "get",
         "post",
@@ -96,4 +396,6 @@ class FileViewSet(viewsets.ModelViewSet):
     )
 
     def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return File.objects.none()
         return File.objects.all_mine(user=self.request.user)
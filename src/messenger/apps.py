@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MessengerConfig(AppConfig):
@@ -6,3 +7,6 @@ class MessengerConfig(AppConfig):
 
     def ready(self):
         import messenger.signals  # noqa
+
+        # Database may be recreated, e.g. by tests, with reused ids
+        post_migrate.connect(messenger.signals.clear_caches, sender=self)
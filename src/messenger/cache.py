@@ -0,0 +1,40 @@
+from django.apps import apps
+from django.conf import settings
+
+from server.cache import TwoLevelCache
+
+
+class MembershipCache(TwoLevelCache):
+    """
+    Cache of the chat ids every user is a member of
+    """
+
+    key_prefix = "membership"
+
+    def get_chat_ids(self, user_id):
+        """Ids of the chats where the user is a member
+
+        Args:
+            user_id: id of the user
+
+        Returns:
+            frozenset: chat ids
+        """
+        return self.get(user_id)
+
+    def is_member(self, user_id, chat_id):
+        return int(chat_id) in self.get_chat_ids(user_id)
+
+    def invalidate(self, user_ids):
+        self.delete_many(user_ids)
+
+    def load(self, user_id):
+        membership = apps.get_model("messenger", "Membership")
+        return frozenset(
+            membership.objects.filter(user=user_id).values_list(
+                "chat", flat=True
+            )
+        )
+
+
+membership_cache = MembershipCache(settings.MEMBERSHIP_CACHE)
@@ -1,4 +1,4 @@
-from django_elasticsearch_dsl import Document
+from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 
 from messenger.models import Chat, File, Message
@@ -6,29 +6,50 @@ from messenger.models import Chat, File, Message
 
 @registry.register_document
 class ChatDocument(Document):
+    creator = fields.IntegerField(attr="creator_id")
+    members = fields.IntegerField(multi=True)
+
     class Index:
         name = "chats"
 
     class Django:
         model = Chat
-        fields = ["id", "name", "users"]
+        fields = ["id", "title", "is_closed", "created_at", "updated_at"]
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related("memberships")
+
+    def prepare_members(self, instance):
+        return [
+            membership.user_id for membership in instance.memberships.all()
+        ]
 
 
 @registry.register_document
 class MessageDocument(Document):
+    chat = fields.IntegerField(attr="chat_id")
+    sender = fields.IntegerField(attr="sender_id")
+
     class Index:
         name = "messages"
 
     class Django:
         model = Message
-        fields = ["id", "text", "chat", "created"]
+        fields = ["id", "text", "status", "created_at", "updated_at"]
 
 
 @registry.register_document
 class FileDocument(Document):
+    document = fields.KeywordField(attr="document.name")
+    message = fields.IntegerField(attr="message_id")
+    chat = fields.IntegerField(attr="message.chat_id")
+
     class Index:
         name = "files"
 
     class Django:
         model = File
-        fields = ["id", "file", "chat", "created"]
+        fields = ["id", "created_at", "updated_at"]
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("message")
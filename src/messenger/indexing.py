@@ -0,0 +1,476 @@
+import json
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_elasticsearch_dsl.registries import registry
+from django_elasticsearch_dsl.signals import BaseSignalProcessor
+from elasticsearch.exceptions import ElasticsearchException, NotFoundError
+from elasticsearch.helpers import bulk
+from redis import RedisError
+
+from server.cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class IndexingQueue:
+    """
+    Queue of the objects to index, kept in a Redis list out of the caches
+
+    Entries are `[model label, pk, attempt]`. The objects are loaded when
+    their batch is indexed, so whatever happened to an object in between,
+    it's indexed as it is now or deleted from the index if it's gone.
+
+    Taken entries are moved to the processing list until they're
+    acknowledged, so a batch of a crashed worker is put back by `recover`.
+    Options are read from `INDEXING_QUEUE` on every use, so they follow
+    overridden settings.
+    """
+
+    @property
+    def options(self):
+        return settings.INDEXING_QUEUE
+
+    @property
+    def client(self):
+        return get_redis(self.options["LOCATION"])
+
+    @property
+    def key(self):
+        return self.options["KEY"]
+
+    @property
+    def processing_key(self):
+        return f"{self.key}:processing"
+
+    def push(self, entries):
+        # Entries are taken from the tail, the oldest first
+        if entries:
+            self.client.lpush(
+                self.key, *(json.dumps(entry) for entry in entries)
+            )
+
+    def pop(self, size):
+        """Move entries from the tail of the queue to the processing list
+
+        Args:
+            size: maximum number of the entries
+
+        Returns:
+            list: entries
+        """
+        with self.client.pipeline(transaction=False) as pipeline:
+            for _ in range(size):
+                pipeline.rpoplpush(self.key, self.processing_key)
+            data = pipeline.execute()
+        return [json.loads(item) for item in data if item is not None]
+
+    def ack(self, entries):
+        """Drop processed entries from the processing list
+
+        Args:
+            entries: entries returned by `pop`
+        """
+        if not entries:
+            return
+        with self.client.pipeline(transaction=False) as pipeline:
+            for entry in entries:
+                pipeline.lrem(self.processing_key, 1, json.dumps(entry))
+            pipeline.execute()
+
+    def recover(self):
+        """Put entries left in the processing list back to the queue
+
+        Returns:
+            int: number of the recovered entries
+        """
+        recovered = 0
+        while self.client.rpoplpush(self.processing_key, self.key):
+            recovered += 1
+        return recovered
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+
+indexing_queue = IndexingQueue()
+
+
+def enqueue(model, pks):
+    """Queue objects to be indexed once the transaction is committed
+
+    Covers the changes which don't send model signals, e.g. `bulk_create`.
+
+    Args:
+        model: model of the objects
+        pks: primary keys of the objects
+    """
+    if not settings.ELASTICSEARCH_ENABLED or not registry.get_documents(
+        (model,)
+    ):
+        return
+
+    entries = [[model._meta.label_lower, pk, 0] for pk in pks]
+
+    def push():
+        try:
+            indexing_queue.push(entries)
+        except RedisError:
+            logger.warning("Indexing queue is unavailable, lost %s", entries)
+
+    transaction.on_commit(push)
+
+
+def index_batch(entries):
+    """Index queued objects with one bulk request per document
+
+    Args:
+        entries: entries of the queue
+
+    Returns:
+        list: entries which failed to be indexed
+    """
+    pks = defaultdict(set)
+    for label, pk, _ in entries:
+        pks[label].add(pk)
+
+    failed = set()
+    for label, model_pks in pks.items():
+        model = apps.get_model(label)
+        for document_class in registry.get_documents((model,)):
+            document = document_class()
+            found = list(document.get_queryset().filter(pk__in=model_pks))
+            missing = model_pks - {instance.pk for instance in found}
+            try:
+                if found:
+                    document.update(found)
+                if missing:
+                    document.update(
+                        [model(pk=pk) for pk in missing],
+                        action="delete",
+                        raise_on_error=False,
+                    )
+            except ElasticsearchException:
+                logger.warning(
+                    "Failed to index %s",
+                    document_class.__name__,
+                    exc_info=True,
+                )
+                failed.add(label)
+
+    return [entry for entry in entries if entry[0] in failed]
+
+
+def get_checkpoint_key(alias):
+    # Kept next to the queue the changes are replayed into
+    return f"{indexing_queue.key}:reindex:{alias}"
+
+
+def get_changes_key(alias):
+    return f"{get_checkpoint_key(alias)}:changes"
+
+
+def record_changes(entries):
+    """Log the entries of the documents whose indexes are being rebuilt
+
+    They're logged before they're indexed, so an entry indexed into the
+    old index is always replayed into the new one by `Reindex`.
+
+    Args:
+        entries: entries of the queue
+    """
+    aliases = defaultdict(list)
+    for entry in entries:
+        model = apps.get_model(entry[0])
+        for document_class in registry.get_documents((model,)):
+            aliases[document_class._index._name].append(entry)
+
+    client = indexing_queue.client
+    for alias, alias_entries in aliases.items():
+        if not client.exists(get_checkpoint_key(alias)):
+            continue
+        with client.pipeline() as pipeline:
+            pipeline.rpush(
+                get_changes_key(alias),
+                *(json.dumps(entry) for entry in alias_entries),
+            )
+            pipeline.expire(get_changes_key(alias), Reindex.checkpoint_timeout)
+            pipeline.execute()
+
+
+def process_queue():
+    """Index a batch from the queue, putting failed entries back
+
+    The batch is acknowledged once it's indexed, so if the worker dies
+    meanwhile it stays in the processing list.
+
+    Returns:
+        tuple: numbers of the processed and failed entries
+    """
+    entries = indexing_queue.pop(settings.INDEXING_QUEUE["BATCH_SIZE"])
+    if not entries:
+        return 0, 0
+
+    record_changes(entries)
+    failed = index_batch(entries)
+    retried = []
+    for label, pk, attempt in failed:
+        if attempt + 1 < settings.INDEXING_QUEUE["MAX_ATTEMPTS"]:
+            retried.append([label, pk, attempt + 1])
+        else:
+            logger.error("Gave up indexing %s %s", label, pk)
+    indexing_queue.push(retried)
+    indexing_queue.ack(entries)
+
+    return len(entries), len(failed)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Signal processor queueing changed objects instead of indexing them
+
+    The queue is indexed in bulks by `process_index_queue` command, so
+    requests neither wait for Elasticsearch nor fail with it.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+        models.signals.m2m_changed.connect(self.handle_m2m_changed)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+        models.signals.m2m_changed.disconnect(self.handle_m2m_changed)
+
+    def handle_m2m_changed(self, sender, instance, action, **kwargs):
+        if action not in ("post_add", "post_remove", "post_clear"):
+            return
+
+        enqueue(instance.__class__, (instance.pk,))
+        if kwargs["pk_set"]:
+            enqueue(kwargs["model"], kwargs["pk_set"])
+
+    def handle_save(self, sender, instance, **kwargs):
+        enqueue(instance.__class__, (instance.pk,))
+
+    def handle_delete(self, sender, instance, **kwargs):
+        enqueue(instance.__class__, (instance.pk,))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Reindex:
+    """
+    Rebuild of the index of a document without downtime
+
+    Objects are streamed by pk with a server-side cursor into a new index,
+    `<alias>-<timestamp>`, and the name of the document's index is pointed
+    to it by an alias once it's complete, atomically dropping the previous
+    index. Chunks are prepared and sent in a pool of workers, the pk of the
+    last chunk done is saved as a checkpoint to resume an interrupted
+    rebuild from.
+
+    While the checkpoint exists, the queue worker logs the entries it takes
+    for the document by `record_changes`. They're queued again once the
+    new index is swapped in, so changes and deletes indexed into the old
+    index only reach the new one too.
+    """
+
+    checkpoint_timeout = 7 * 24 * 60 * 60
+
+    def __init__(self, document_class, chunk_size=2000, workers=4):
+        self.document = document_class()
+        self.alias = document_class._index._name
+        self.connection = document_class._get_connection()
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+    @property
+    def checkpoint_key(self):
+        return get_checkpoint_key(self.alias)
+
+    @property
+    def changes_key(self):
+        return get_changes_key(self.alias)
+
+    def load_checkpoint(self):
+        data = indexing_queue.client.get(self.checkpoint_key)
+        if data is None:
+            return None
+
+        checkpoint = json.loads(data)
+        checkpoint["started_at"] = parse_datetime(checkpoint["started_at"])
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        indexing_queue.client.set(
+            self.checkpoint_key,
+            json.dumps(checkpoint, cls=DjangoJSONEncoder),
+            ex=self.checkpoint_timeout,
+        )
+
+    def delete_checkpoint(self):
+        indexing_queue.client.delete(self.checkpoint_key, self.changes_key)
+
+    def run(self, resume=False, progress=None):
+        """Rebuild the index and swap it in
+
+        Args:
+            resume: continue the rebuild from the checkpoint if there is one
+            progress: callable getting the number of the indexed objects
+             after every chunk
+
+        Returns:
+            str: name of the new index
+        """
+        checkpoint = self.load_checkpoint() if resume else None
+        if checkpoint is None:
+            self.delete_checkpoint()
+            checkpoint = {
+                "index": self.create_index(),
+                "pk": None,
+                "started_at": timezone.now(),
+            }
+            self.save_checkpoint(checkpoint)
+
+        queryset = self.document.get_queryset().order_by("pk")
+        if checkpoint["pk"] is not None:
+            queryset = queryset.filter(pk__gt=checkpoint["pk"])
+        lookups = queryset._prefetch_related_lookups
+
+        indexed, pending = 0, deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # `iterator` ignores prefetches, so chunks are prefetched here,
+            # on the connection of the cursor
+            for chunk in chunked(
+                queryset.iterator(chunk_size=self.chunk_size),
+                self.chunk_size,
+            ):
+                prefetch_related_objects(chunk, *lookups)
+                pending.append(
+                    (
+                        chunk[-1].pk,
+                        executor.submit(
+                            self.index_chunk, checkpoint["index"], chunk
+                        ),
+                    )
+                )
+                # Chunks are done in order, so the checkpoint never skips
+                # one which is still in flight
+                while len(pending) > self.workers or (
+                    pending and pending[0][1].done()
+                ):
+                    checkpoint["pk"], future = pending.popleft()
+                    indexed += future.result()
+                    self.save_checkpoint(checkpoint)
+                    if progress is not None:
+                        progress(indexed)
+
+            while pending:
+                checkpoint["pk"], future = pending.popleft()
+                indexed += future.result()
+                if progress is not None:
+                    progress(indexed)
+
+        self.swap_index(checkpoint["index"])
+        self.replay_changes()
+        self.requeue_changed(checkpoint["started_at"])
+        self.delete_checkpoint()
+        return checkpoint["index"]
+
+    def create_index(self):
+        name = f"{self.alias}-{timezone.now():%Y%m%d%H%M%S}"
+        index = self.document._index.clone(name=name)
+        # Refreshes only slow down the bulk load of an unused index
+        index.settings(refresh_interval="-1")
+        index.create(using=self.connection)
+        return name
+
+    def index_chunk(self, index, chunk):
+        """Prepare and index a chunk of the objects with one bulk request
+
+        Args:
+            index: name of the new index
+            chunk: objects with prefetched relations
+
+        Returns:
+            int: number of the indexed objects
+        """
+        actions = [
+            {
+                **self.document._prepare_action(instance, "index"),
+                "_index": index,
+            }
+            for instance in chunk
+            if self.document.should_index_object(instance)
+        ]
+        indexed, _ = bulk(
+            self.connection, actions, chunk_size=len(actions) or 1
+        )
+        return indexed
+
+    def swap_index(self, index):
+        self.connection.indices.put_settings(
+            index=index, body={"index": {"refresh_interval": None}}
+        )
+        self.connection.indices.refresh(index=index)
+
+        try:
+            previous = self.connection.indices.get_alias(index=self.alias)
+        except NotFoundError:
+            previous = {}
+        actions = [{"add": {"index": index, "alias": self.alias}}]
+        # Also replaces an index created under the name of the alias
+        actions += [
+            {"remove_index": {"index": name}}
+            for name in previous
+            if name != index
+        ]
+        self.connection.indices.update_aliases(body={"actions": actions})
+
+    def replay_changes(self):
+        """Queue again the entries taken by the worker during the rebuild
+
+        Returns:
+            int: number of the queued entries
+        """
+        client, replayed = indexing_queue.client, 0
+        while client.rpoplpush(self.changes_key, indexing_queue.key):
+            replayed += 1
+        return replayed
+
+    def requeue_changed(self, since):
+        """Queue the objects changed while the old index was served
+
+        Covers the changes which weren't queued, e.g. by `update`, so
+        they aren't among the replayed entries.
+
+        Args:
+            since: start of the rebuild
+        """
+        model = self.document.django.model
+        indexing_queue.push(
+            [
+                [model._meta.label_lower, pk, 0]
+                for pk in model.objects.filter(
+                    updated_at__gte=since
+                ).values_list("pk", flat=True)
+            ]
+        )
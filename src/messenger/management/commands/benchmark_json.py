@@ -0,0 +1,61 @@
+import io
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from messenger.api.v1.serializers import MessageViewSerializer
+from messenger.models import Message
+from server.parsers import OrjsonParser
+from server.renderers import OrjsonRenderer, orjson
+
+
+class Command(BaseCommand):
+
+    help = "Compare JSON renderers and parsers on a page of messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-l", "--limit", type=int, default=100)
+        parser.add_argument("-r", "--repeat", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write("orjson isn't installed, both use stdlib")
+
+        messages = Message.objects.select_related(
+            "sender", "chat__creator"
+        ).prefetch_related("chat__invited", "file_set")[: options["limit"]]
+        page = {
+            "next": None,
+            "previous": None,
+            "results": MessageViewSerializer(messages, many=True).data,
+        }
+        if not page["results"]:
+            raise CommandError("No messages, run fill_database first")
+
+        body = JSONRenderer().render(page)
+        self.stdout.write(
+            f"{len(page['results'])} messages, {len(body)} bytes, "
+            f"{options['repeat']} runs"
+        )
+
+        for name, stdlib, fast in (
+            (
+                "render",
+                lambda: JSONRenderer().render(page),
+                lambda: OrjsonRenderer().render(page),
+            ),
+            (
+                "parse",
+                lambda: JSONParser().parse(io.BytesIO(body)),
+                lambda: OrjsonParser().parse(io.BytesIO(body)),
+            ),
+        ):
+            stdlib_time = timeit.timeit(stdlib, number=options["repeat"])
+            fast_time = timeit.timeit(fast, number=options["repeat"])
+            self.stdout.write(
+                f"{name}: stdlib {stdlib_time * 1000:.1f} ms, "
+                f"orjson {fast_time * 1000:.1f} ms, "
+                f"{stdlib_time / fast_time:.1f}x"
+            )
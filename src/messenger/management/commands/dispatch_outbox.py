@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from messenger.outbox import dispatch_outbox
+
+
+class Command(BaseCommand):
+
+    help = "Send the websocket events left in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the outbox is empty",
+        )
+
+    def handle(self, *args, **options):
+        loop = asyncio.new_event_loop()
+        while True:
+            try:
+                sent = dispatch_outbox(loop)
+            except Exception as exc:  # pylint: disable=broad-except
+                self.stderr.write(f"Failed to dispatch the outbox: {exc}")
+                time.sleep(settings.OUTBOX["RETRY_DELAY"])
+                continue
+
+            if sent:
+                self.stdout.write(f"Sent {sent} events")
+            elif options["once"]:
+                return
+            else:
+                time.sleep(settings.OUTBOX["POLL_INTERVAL"])
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from server.schema import FORMATS, generate_schema, get_schema_path
+
+
+class Command(BaseCommand):
+
+    help = "Write the OpenAPI schema served by the API"
+
+    def handle(self, *args, **options):
+        settings.SCHEMA_ROOT.mkdir(parents=True, exist_ok=True)
+
+        for extension in FORMATS:
+            path = get_schema_path(extension)
+            path.write_bytes(generate_schema(extension))
+            self.stdout.write(f"Schema is written to {path}")
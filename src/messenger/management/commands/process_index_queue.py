@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from redis import RedisError
+
+from messenger.indexing import indexing_queue, process_queue
+
+
+class Command(BaseCommand):
+
+    help = "Index the queued changes into Elasticsearch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        # Batches of a crashed worker
+        recovered = indexing_queue.recover()
+        if recovered:
+            self.stdout.write(f"Recovered {recovered} unprocessed entries")
+
+        while True:
+            try:
+                processed, failed = process_queue()
+            except RedisError as exc:
+                self.stderr.write(f"Indexing queue is unavailable: {exc}")
+                time.sleep(settings.INDEXING_QUEUE["RETRY_DELAY"])
+                continue
+
+            if processed:
+                self.stdout.write(
+                    f"Indexed {processed - failed}, failed {failed}"
+                )
+
+            if failed:
+                time.sleep(settings.INDEXING_QUEUE["RETRY_DELAY"])
+            elif not processed:
+                if options["once"]:
+                    return
+                time.sleep(settings.INDEXING_QUEUE["POLL_INTERVAL"])
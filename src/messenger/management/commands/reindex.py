@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django_elasticsearch_dsl.registries import registry
+
+from messenger.indexing import Reindex
+
+
+class Command(BaseCommand):
+
+    help = "Rebuild the Elasticsearch indices and swap them in by aliases"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            nargs="*",
+            metavar="app_label.model_name",
+            help="Rebuild only the indices of the models",
+        )
+        parser.add_argument("-c", "--chunk-size", type=int, default=2000)
+        parser.add_argument("-w", "--workers", type=int, default=4)
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue interrupted rebuilds from their checkpoints",
+        )
+
+    def handle(self, *args, **options):
+        documents = registry.get_documents()
+        if options["models"]:
+            labels = {label.lower() for label in options["models"]}
+            documents = {
+                document
+                for document in documents
+                if document.django.model._meta.label_lower in labels
+            }
+            if not documents:
+                raise CommandError("No documents of the models")
+
+        for document in sorted(documents, key=lambda item: item.__name__):
+            reindex = Reindex(
+                document,
+                chunk_size=options["chunk_size"],
+                workers=options["workers"],
+            )
+            started = time.perf_counter()
+
+            def progress(indexed):
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{reindex.alias}: {indexed} documents, "
+                    f"{indexed / elapsed:.0f}/s"
+                )
+
+            index = reindex.run(resume=options["resume"], progress=progress)
+            self.stdout.write(
+                f"{reindex.alias} now serves {index}, "
+                f"took {time.perf_counter() - started:.1f} s"
+            )
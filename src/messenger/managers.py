@@ -1,4 +1,51 @@
-from django.db.models import Manager, Q
+from django.apps import apps
+from django.db import transaction
+from django.db.models import (
+    Count,
+    Exists,
+    IntegerField,
+    Manager,
+    OuterRef,
+    Q,
+    Subquery,
+)
+from django.db.models.functions import Coalesce, Left
+from django.utils import timezone
+
+from messenger.cache import membership_cache
+from messenger.websocket.events import get_memberships_events, send_events
+
+
+def member_chats(user):
+    """Ids of the chats where the user is a member
+
+    Args:
+        user: user instance
+
+    Returns:
+        frozenset: chat ids from the membership cache
+    """
+    return membership_cache.get_chat_ids(user.id)
+
+
+def invalidate_memberships(user_ids):
+    """Drop cached memberships of the users now and after the commit
+
+    The second invalidation drops entries cached from a snapshot taken
+    before the transaction which changed the memberships was committed.
+    Then the users' websocket connections are told to update their chats.
+
+    Args:
+        user_ids: ids of the users
+    """
+    user_ids = set(user_ids)
+    membership_cache.invalidate(user_ids)
+
+    def committed():
+        membership_cache.invalidate(user_ids)
+        send_events(get_memberships_events(user_ids))
+
+    transaction.on_commit(committed)
 
 
 class ChatManager(Manager):
@@ -14,7 +61,7 @@ class ChatManager(Manager):
                 "creator",
                 "invited",
             )
-            .exclude(Q(creator=user.id) | Q(invited=user.id))
+            .exclude(id__in=member_chats(user))
         )
 
     def all_mine_and_invited(self, user):
@@ -25,7 +72,7 @@ class ChatManager(Manager):
                 "creator",
                 "invited",
             )
-            .filter(Q(creator=user.id) | Q(invited=user.id))
+            .filter(id__in=member_chats(user))
         )
 
     def all_mine(self, user):
@@ -36,7 +83,183 @@ class ChatManager(Manager):
                 "creator",
                 "invited",
             )
-            .filter(Q(creator=user.id))
+            .filter(creator=user.id)
+        )
+
+    def inbox(self, user):
+        """Chats of the user with the latest message and unread count
+
+        Only the id of the latest message is looked up in the
+        (chat, -created_at, -id) index, its time is then read by the
+        primary key to order the chats. The messages themselves are
+        loaded for the page by `attach_last_messages`.
+
+        Args:
+            user: user instance
+
+        Returns:
+            queryset: chats ordered by the last activity
+        """
+        message = apps.get_model("messenger", "Message")
+        last_message = (
+            message.objects.filter(chat=OuterRef("pk"))
+            .order_by("-created_at", "-id")
+            .values("id")[:1]
+        )
+        unread = (
+            apps.get_model("messenger", "Membership")
+            .objects.with_unread_count()
+            .filter(user=user.id, chat=OuterRef("pk"))
+            .values("unread_count")
+        )
+        return (
+            super()
+            .get_queryset()
+            .filter(id__in=member_chats(user))
+            .annotate(
+                last_message_id=Subquery(last_message),
+                last_message_at=Subquery(
+                    message.objects.filter(
+                        pk=OuterRef("last_message_id")
+                    ).values("created_at")
+                ),
+                unread_count=Coalesce(
+                    Subquery(unread, output_field=IntegerField()), 0
+                ),
+                last_activity_at=Coalesce("last_message_at", "created_at"),
+            )
+            .order_by("-last_activity_at", "-id")
+        )
+
+    def attach_last_messages(self, chats, preview_length=100):
+        """Load the latest messages of the inbox chats by one query
+
+        Args:
+            chats: chats from `inbox`
+            preview_length: number of characters of the message preview
+
+        Returns:
+            list: the chats with `last_message` set
+        """
+        chats = list(chats)
+        messages = (
+            apps.get_model("messenger", "Message")
+            .objects.filter(
+                id__in=[
+                    chat.last_message_id
+                    for chat in chats
+                    if chat.last_message_id is not None
+                ]
+            )
+            .annotate(preview=Left("text", preview_length))
+            .only("id", "sender", "created_at")
+            .in_bulk()
+        )
+        for chat in chats:
+            chat.last_message = messages.get(chat.last_message_id)
+        return chats
+
+
+class MembershipManager(Manager):  # noqa
+    """
+    Membership manager
+    """
+
+    def sync(self, chat):
+        """Make chat memberships match its creator and invited users
+
+        Args:
+            chat: chat instance
+
+        Returns:
+            bool: True when the memberships have been changed
+        """
+        user_ids = {chat.creator_id}
+        user_ids.update(chat.invited.values_list("id", flat=True))
+
+        existing = set(
+            self.filter(chat=chat).values_list("user_id", flat=True)
+        )
+        if existing - user_ids:
+            self.filter(chat=chat, user__in=existing - user_ids).delete()
+        if user_ids - existing:
+            # New members start reading from the latest message
+            last_message = (
+                apps.get_model("messenger", "Message")
+                .objects.filter(chat=chat)
+                .order_by("-id")
+                .values_list("id", flat=True)
+                .first()
+            )
+            self.bulk_create(
+                (
+                    self.model(
+                        chat=chat,
+                        user_id=user_id,
+                        last_read_message_id=last_message,
+                    )
+                    for user_id in user_ids - existing
+                ),
+                ignore_conflicts=True,
+            )
+
+        if existing != user_ids:
+            invalidate_memberships(existing ^ user_ids)
+            return True
+        return False
+
+    def with_unread_count(self):
+        """Annotate memberships with the number of unread messages
+
+        Messages after the read cursor are counted by a range scan over
+        the (chat, id) index, own messages are never unread.
+
+        Returns:
+            queryset: memberships annotated with `unread_count`
+        """
+        unread = (
+            apps.get_model("messenger", "Message")
+            .objects.filter(
+                chat=OuterRef("chat"),
+                id__gt=Coalesce(OuterRef("last_read_message"), 0),
+            )
+            .exclude(sender=OuterRef("user"))
+            .order_by()
+            .values("chat")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.annotate(
+            unread_count=Coalesce(
+                Subquery(unread, output_field=IntegerField()), 0
+            )
+        )
+
+    def mark_read(self, user, chat_id, message_id):
+        """Move the read cursor of the user up to the message
+
+        The cursor only moves forward and only to a message of the chat,
+        both conditions are checked by the same UPDATE statement.
+
+        Args:
+            user: user instance
+            chat_id: id of the chat
+            message_id: id of the last read message
+
+        Returns:
+            int: number of updated memberships
+        """
+        message = apps.get_model("messenger", "Message").objects.filter(
+            pk=message_id, chat=chat_id
+        )
+        return (
+            self.filter(user=user.id, chat=chat_id)
+            .filter(
+                Q(last_read_message__isnull=True)
+                | Q(last_read_message__lt=message_id)
+            )
+            .filter(Exists(message))
+            .update(last_read_message=message_id, updated_at=timezone.now())
         )
 
 
@@ -54,7 +277,7 @@ class MessageManager(Manager):  # noqa
                 "chat__creator",
                 "chat__invited",
             )
-            .filter(Q(chat__creator=user.id) | Q(chat__invited=user.id))
+            .filter(chat__in=member_chats(user))
         )
 
 
@@ -73,8 +296,5 @@ class FileManager(Manager):  # noqa
                 "message__chat__creator",
                 "message__chat__invited",
             )
-            .filter(
-                Q(message__chat__creator=user.id)
-                | Q(message__chat__invited=user.id)
-            )
+            .filter(message__chat__in=member_chats(user))
         )
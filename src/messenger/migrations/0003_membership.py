@@ -0,0 +1,76 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_memberships(apps, schema_editor):  # noqa
+    chat_model = apps.get_model("messenger", "Chat")
+    membership_model = apps.get_model("messenger", "Membership")
+
+    memberships = set(chat_model.objects.values_list("id", "creator_id"))
+    memberships.update(
+        chat_model.invited.through.objects.values_list("chat_id", "user_id")
+    )
+    membership_model.objects.bulk_create(
+        (
+            membership_model(chat_id=chat_id, user_id=user_id)
+            for chat_id, user_id in memberships
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("messenger", "0002_alter_file_document"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Membership",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "chat",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="messenger.chat",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="membership",
+            constraint=models.UniqueConstraint(
+                fields=("user", "chat"),
+                name="messenger_membership_user_chat_unique",
+            ),
+        ),
+        migrations.RunPython(
+            code=create_memberships,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
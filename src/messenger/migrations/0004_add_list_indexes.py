@@ -0,0 +1,40 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0003_membership"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chat",
+            index=models.Index(
+                fields=["creator", "-created_at"],
+                name="chat_creator_created_at_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chat",
+            index=models.Index(
+                fields=["-created_at"], name="chat_created_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(
+                fields=["message", "-created_at"],
+                name="file_message_created_at_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["chat", "-created_at", "-id"],
+                name="message_chat_created_at_idx",
+            ),
+        ),
+    ]
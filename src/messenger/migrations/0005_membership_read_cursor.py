@@ -0,0 +1,49 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def start_cursors_at_latest_message(apps, schema_editor):  # noqa
+    membership_model = apps.get_model("messenger", "Membership")
+    message_model = apps.get_model("messenger", "Message")
+
+    membership_model.objects.update(
+        last_read_message=Subquery(
+            message_model.objects.filter(chat=OuterRef("chat"))
+            .order_by("-id")
+            .values("id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0004_add_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="membership",
+            name="last_read_message",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="messenger.message",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["chat", "id"], name="message_chat_id_idx"
+            ),
+        ),
+        migrations.RunPython(
+            code=start_cursors_at_latest_message,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.13 on 2026-10-18 20:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0005_membership_read_cursor"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chat",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "title", config="simple"
+                ),
+                name="chat_title_search_idx",
+            ),
+        ),
+    ]
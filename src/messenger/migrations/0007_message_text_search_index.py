@@ -0,0 +1,24 @@
+# Generated by Django 3.2.13 on 2026-10-18 21:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0006_chat_title_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "text", config="simple"
+                ),
+                name="message_text_search_idx",
+            ),
+        ),
+    ]
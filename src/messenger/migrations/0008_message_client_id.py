@@ -0,0 +1,25 @@
+# Generated by Django 3.2.13 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0007_message_text_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="client_id",
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="message",
+            constraint=models.UniqueConstraint(
+                fields=("sender", "client_id"),
+                name="messenger_message_sender_client_id_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.13 on 2026-10-18 21:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0009_outbox_event"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="membership",
+            name="last_read_message",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="messenger.message",
+            ),
+        ),
+    ]
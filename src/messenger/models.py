@@ -1,18 +1,31 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db.models import (
     CASCADE,
+    DO_NOTHING,
     BooleanField,
     CharField,
+    DateTimeField,
     ForeignKey,
+    Index,
+    JSONField,
     ManyToManyField,
     Model,
     PositiveSmallIntegerField,
     TextField,
+    UniqueConstraint,
+    UUIDField,
 )
 
 from .choices import STATUS
 from .fields import ContentTypeRestrictedFileField
-from .managers import ChatManager, FileManager, MessageManager
+from .managers import (
+    ChatManager,
+    FileManager,
+    MembershipManager,
+    MessageManager,
+)
 from .mixins import TimestampMixin
 
 User = get_user_model()
@@ -30,6 +43,59 @@ class Chat(TimestampMixin, Model):
 
     objects = ChatManager()
 
+    class Meta:
+        indexes = (
+            Index(
+                fields=("creator", "-created_at"),
+                name="chat_creator_created_at_idx",
+            ),
+            Index(
+                fields=("-created_at",),
+                name="chat_created_at_idx",
+            ),
+            # Served to `FullTextSearchFilter` of the chat search
+            GinIndex(
+                SearchVector("title", config="simple"),
+                name="chat_title_search_idx",
+            ),
+        )
+
+
+class Membership(TimestampMixin, Model):
+    """
+    Membership model, one row per user per chat including its creator
+    """
+
+    chat = ForeignKey(
+        to=Chat,
+        on_delete=CASCADE,
+        related_name="memberships",
+    )
+    user = ForeignKey(
+        to=User,
+        on_delete=CASCADE,
+        related_name="memberships",
+    )
+    last_read_message = ForeignKey(
+        to="Message",
+        # The cursor only orders messages, it must survive their deletion
+        on_delete=DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+
+    objects = MembershipManager()
+
+    class Meta:
+        constraints = (
+            UniqueConstraint(
+                fields=("user", "chat"),
+                name="messenger_membership_user_chat_unique",
+            ),
+        )
+
 
 class Message(TimestampMixin, Model):
     """
@@ -51,9 +117,35 @@ class Message(TimestampMixin, Model):
         choices=STATUS.choices,
         default=STATUS.NOT_VIEWED,
     )
+    # Generated by the client sending the message over the websocket,
+    # so a resent message is acknowledged instead of saved twice
+    client_id = UUIDField(null=True, blank=True)
 
     objects = MessageManager()
 
+    class Meta:
+        constraints = (
+            UniqueConstraint(
+                fields=("sender", "client_id"),
+                name="messenger_message_sender_client_id_unique",
+            ),
+        )
+        indexes = (
+            Index(
+                fields=("chat", "-created_at", "-id"),
+                name="message_chat_created_at_idx",
+            ),
+            Index(
+                fields=("chat", "id"),
+                name="message_chat_id_idx",
+            ),
+            # Served to `MessageSearch` when Elasticsearch is disabled
+            GinIndex(
+                SearchVector("text", config="simple"),
+                name="message_text_search_idx",
+            ),
+        )
+
 
 class File(TimestampMixin, Model):
     """
@@ -66,3 +158,24 @@ class File(TimestampMixin, Model):
     message = ForeignKey(Message, on_delete=CASCADE)
 
     objects = FileManager()
+
+    class Meta:
+        indexes = (
+            Index(
+                fields=("message", "-created_at"),
+                name="file_message_created_at_idx",
+            ),
+        )
+
+
+class OutboxEvent(Model):
+    """
+    Websocket event waiting to be sent to its channel layer group
+
+    Events are written in the transaction which caused them and sent
+    after its commit, see `messenger.outbox`.
+    """
+
+    group = CharField(max_length=100)
+    event = JSONField()
+    created_at = DateTimeField(auto_now_add=True)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import threading
+import uuid
+from collections import defaultdict
+
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Min
+
+logger = logging.getLogger(__name__)
+
+# First key of the advisory locks of the groups, keeps them apart from
+# other advisory locks of the database
+OUTBOX_LOCK_KEY = 0x6F7574
+
+
+def lock_groups(groups):
+    """Take the transaction level locks of the groups free to be sent
+
+    Args:
+        groups: names of the groups
+
+    Returns:
+        list: names of the locked groups
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM unnest(%s::text[]) AS name "
+            "WHERE pg_try_advisory_xact_lock(%s, hashtext(name))",
+            [list(groups), OUTBOX_LOCK_KEY],
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+async def group_send_batch(events):
+    """Send events to their groups, keeping their order within a group
+
+    Args:
+        events: pairs of a group name and an event
+    """
+    channel_layer = get_channel_layer()
+    groups = defaultdict(list)
+    for group, event in events:
+        if event.get("type") == "send_json":
+            # Keyed for the connections to share the encoded frames
+            event = {
+                "type": "send.encoded",
+                "key": uuid.uuid4().hex,
+                "content": event,
+            }
+        groups[group].append(event)
+
+    async def send(group, group_events):
+        for event in group_events:
+            await channel_layer.group_send(group, event)
+
+    await asyncio.gather(
+        *(send(group, group_events) for group, group_events in groups.items())
+    )
+
+
+def dispatch_outbox(loop=None):
+    """Send a batch of the committed events and delete them
+
+    A dispatcher sends the events of the groups it holds the advisory
+    locks of, oldest first, so concurrent dispatchers take different
+    groups and the events of a group are never sent out of order. A batch
+    which fails to be sent stays in the outbox, so every event is sent at
+    least once.
+
+    Args:
+        loop: event loop to send the events in, a new one by default
+
+    Returns:
+        int: number of the sent events
+    """
+    outbox_event = apps.get_model("messenger", "OutboxEvent")
+    batch_size = settings.OUTBOX["BATCH_SIZE"]
+    with transaction.atomic():
+        groups = lock_groups(
+            outbox_event.objects.values("group")
+            .annotate(first_id=Min("id"))
+            .order_by("first_id")
+            .values_list("group", flat=True)[:batch_size]
+        )
+        events = list(
+            outbox_event.objects.filter(group__in=groups).order_by("id")[
+                :batch_size
+            ]
+        )
+        if not events:
+            return 0
+
+        sending = group_send_batch(
+            [(item.group, item.event) for item in events]
+        )
+        if loop is None:
+            asyncio.run(sending)
+        else:
+            loop.run_until_complete(sending)
+        outbox_event.objects.filter(
+            pk__in=[item.pk for item in events]
+        ).delete()
+    return len(events)
+
+
+class OutboxDispatcher:
+    """
+    Background thread of the process sending the outbox after commits
+
+    Commits which wrote events wake it up, so requests don't wait for the
+    channel layer. The thread keeps its event loop, and with it the
+    connections of the channel layer, between the batches. Events left by
+    other processes are swept by `dispatch_outbox` command.
+    """
+
+    def __init__(self):
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def wake(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="outbox-dispatcher", daemon=True
+                )
+                self.thread.start()
+        self.wakeup.set()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        timeout = None
+        while True:
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+            try:
+                while dispatch_outbox(loop):
+                    pass
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Failed to dispatch the outbox", exc_info=True)
+                timeout = settings.OUTBOX["RETRY_DELAY"]
+            else:
+                timeout = None
+            finally:
+                connections.close_all()
+
+
+outbox_dispatcher = OutboxDispatcher()
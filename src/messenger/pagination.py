@@ -0,0 +1,408 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (
+    BasePagination,
+    LimitOffsetPagination,
+    _positive_int,
+)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on `(created_at, id)`
+
+    Pages are requested with `?before=<cursor>` (older items) or
+    `?after=<cursor>` (newer items). Every page is a range scan from
+    the cursor, so its cost doesn't depend on how deep the client scrolls
+    and no COUNT(*) is issued.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    page_size_query_param = "limit"
+    before_query_param = "before"
+    after_query_param = "after"
+    ordering = ("created_at", "id")
+    invalid_cursor_message = "Invalid cursor"
+    both_cursors_message = "Only one of `{before}` and `{after}` is allowed"
+
+    def __init__(self):
+        self.request = None
+        self.older = None
+        self.newer = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        before = self.decode_cursor(request, self.before_query_param)
+        after = self.decode_cursor(request, self.after_query_param)
+        if before is not None and after is not None:
+            raise ValidationError(
+                self.both_cursors_message.format(
+                    before=self.before_query_param,
+                    after=self.after_query_param,
+                )
+            )
+
+        if after is not None:
+            queryset = queryset.filter(self.get_keyset_filter(after, "gt"))
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            if before is not None:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(before, "lt")
+                )
+            queryset = queryset.order_by(
+                *(f"-{field}" for field in self.ordering)
+            )
+
+        page = list(queryset[: page_size + 1])
+        has_more = len(page) > page_size
+        del page[page_size:]
+
+        if after is not None:
+            page.reverse()
+
+        # Pages are always returned newest first
+        self.older = self.newer = None
+        if page:
+            if has_more or after is not None:
+                self.older = self.get_key(page[-1])
+            if before is not None or (after is not None and has_more):
+                self.newer = self.get_key(page[0])
+
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if self.older is None:
+            return None
+        return self.build_link(
+            self.before_query_param,
+            self.after_query_param,
+            self.older,
+        )
+
+    def get_previous_link(self):
+        if self.newer is None:
+            return None
+        return self.build_link(
+            self.after_query_param,
+            self.before_query_param,
+            self.newer,
+        )
+
+    def build_link(self, param, other_param, key):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, other_param)
+        return replace_query_param(url, param, self.encode_cursor(key))
+
+    def get_key(self, instance):
+        return tuple(getattr(instance, field) for field in self.ordering)
+
+    def get_keyset_filter(self, key, lookup):
+        (created_at_field, id_field), (created_at, pk) = self.ordering, key
+        return Q(**{f"{created_at_field}__{lookup}": created_at}) | Q(
+            **{created_at_field: created_at, f"{id_field}__{lookup}": pk}
+        )
+
+    @staticmethod
+    def encode_cursor(key):
+        created_at, pk = key
+        value = f"{created_at.isoformat()}|{pk}"
+        return urlsafe_b64encode(value.encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request, param):
+        encoded = request.query_params.get(param)
+        if encoded is None:
+            return None
+
+        try:
+            value = urlsafe_b64decode(encoded.encode("ascii")).decode("ascii")
+            created_at, pk = value.split("|")
+            created_at, pk = parse_datetime(created_at), int(pk)
+        except (TypeError, ValueError):
+            created_at = pk = None
+
+        if created_at is None or pk is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return created_at, pk
+
+    def get_schema_fields(self, view):
+        return [
+            coreapi.Field(
+                name=self.before_query_param,
+                required=False,
+                location="query",
+                schema=coreschema.String(
+                    description="Cursor of the page with older items."
+                ),
+            ),
+            coreapi.Field(
+                name=self.after_query_param,
+                required=False,
+                location="query",
+                schema=coreschema.String(
+                    description="Cursor of the page with newer items."
+                ),
+            ),
+            coreapi.Field(
+                name=self.page_size_query_param,
+                required=False,
+                location="query",
+                schema=coreschema.Integer(
+                    description="Number of results to return per page."
+                ),
+            ),
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.before_query_param,
+                "required": False,
+                "in": "query",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.after_query_param,
+                "required": False,
+                "in": "query",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class SearchAfterPagination(KeysetPagination):
+    """
+    Pagination of search hits continuing after the last hit of the page
+
+    The search is a callable taking the decoded `?before=<cursor>` key and
+    the page size, which returns the page and the key of its last hit if
+    there are more. Hits are only paged towards the older ones.
+    """
+
+    def paginate_search(self, search, request):
+        """Search the requested page
+
+        Args:
+            search: callable searching a page after the key
+            request: Request instance
+
+        Returns:
+            list: objects of the page
+        """
+        self.request = request
+        page, self.older = search(
+            before=self.decode_cursor(request, self.before_query_param),
+            size=self.get_page_size(request),
+        )
+        self.newer = None
+        return page
+
+    def get_schema_fields(self, view):
+        return [
+            field
+            for field in super().get_schema_fields(view)
+            if field.name != self.after_query_param
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            parameter
+            for parameter in super().get_schema_operation_parameters(view)
+            if parameter["name"] != self.after_query_param
+        ]
+
+
+class NoCountPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination without the total count
+
+    One extra row is fetched to tell whether the next page exists, so
+    a page costs a single query instead of the page and a COUNT(*).
+    """
+
+    def __init__(self):
+        self.request = None
+        self.limit = None
+        self.offset = None
+        self.has_next = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        page = list(queryset[self.offset : self.offset + self.limit + 1])
+        self.has_next = len(page) > self.limit
+        del page[self.limit :]
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("has_next", self.has_next),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "has_next": {"type": "boolean"},
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+
+class EstimatedCountPagination(NoCountPagination):
+    """
+    Pagination with the total count estimated by the Postgres planner
+
+    The count is exact while the planner expects less than
+    `exact_count_threshold` rows, above it the estimate is returned and
+    `count_is_estimate` is set.
+    """
+
+    exact_count_threshold = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.count = None
+        self.count_is_estimate = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view=view)
+        if page is not None:
+            self.count, self.count_is_estimate = self.get_count(queryset)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    ("count_is_estimate", self.count_is_estimate),
+                    ("has_next", self.has_next),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"] = OrderedDict(
+            [
+                ("count", {"type": "integer"}),
+                ("count_is_estimate", {"type": "boolean"}),
+                *response_schema["properties"].items(),
+            ]
+        )
+        return response_schema
+
+    def get_count(self, queryset):
+        """Count the rows of the queryset, approximately when it's large
+
+        Args:
+            queryset: queryset of the list
+
+        Returns:
+            tuple: number of rows and True when it's an estimate
+        """
+        estimate = self.get_estimate(queryset)
+        if estimate is None or estimate < self.exact_count_threshold:
+            return queryset.count(), False
+        return estimate, True
+
+    @staticmethod
+    def get_estimate(queryset):
+        """Read the number of rows expected by the planner
+
+        Args:
+            queryset: queryset of the list
+
+        Returns:
+            int: estimated number of rows or None if it's unknown
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+
+        try:
+            sql, params = queryset.order_by().query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        return plan[0]["Plan"]["Plan Rows"]
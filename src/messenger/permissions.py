@@ -0,0 +1,52 @@
+from rest_framework.permissions import BasePermission
+
+from messenger.cache import membership_cache
+
+
+def get_requested_chat_ids(request, view):
+    """Collect ids of the chats the request is about
+
+    Args:
+        request: Request instance
+        view: view instance
+
+    Returns:
+        set: chat ids from the url and the `chat` field of the body
+    """
+    values = []
+
+    lookup_url_kwarg = getattr(view, "chat_lookup_url_kwarg", None)
+    if lookup_url_kwarg in view.kwargs:
+        values.append(view.kwargs[lookup_url_kwarg])
+
+    if request.method not in ("GET", "HEAD", "OPTIONS", "DELETE"):
+        data = request.data
+        for item in data if isinstance(data, list) else (data,):
+            if hasattr(item, "get") and item.get("chat") not in (None, ""):
+                values.append(item.get("chat"))
+
+    chat_ids = set()
+    for value in values:
+        try:
+            chat_ids.add(int(value))
+        except (TypeError, ValueError):
+            # Left to the validation of the serializer
+            continue
+    return chat_ids
+
+
+class IsChatMember(BasePermission):
+    """
+    Allows access only to members of the chats referenced by the request
+
+    Chats are taken from `view.chat_lookup_url_kwarg` and from the `chat`
+    field of the request body, membership comes from the cache.
+    """
+
+    message = "You are not a member of this chat."
+
+    def has_permission(self, request, view):
+        chat_ids = get_requested_chat_ids(request, view)
+        if not chat_ids:
+            return True
+        return chat_ids <= membership_cache.get_chat_ids(request.user.id)
@@ -7,7 +7,7 @@ from messenger.api.v1.views import (
     MessageViewSet,
     SearchChatViewSet,
 )
-from messenger.websocket.consumers import ChatConsumer
+from messenger.websocket.consumers import ChatConsumer, UserConsumer
 
 router = DefaultRouter(trailing_slash=False)
 
@@ -38,4 +38,9 @@ websocket_urlpatterns = [
         view=ChatConsumer.as_asgi(),
         name="chat-poll",
     ),
+    re_path(
+        route=r"ws/user$",
+        view=UserConsumer.as_asgi(),
+        name="user-poll",
+    ),
 ]
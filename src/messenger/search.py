@@ -0,0 +1,180 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db.models import F, Q
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from messenger.documents import MessageDocument
+
+
+class PrefixSearchQuery(SearchQuery):
+    """
+    Full text query matching documents with words starting with every term
+    """
+
+    def __init__(self, terms, config=None):
+        value = " & ".join(
+            "'{}':*".format(term.replace("\\", "\\\\").replace("'", "''"))
+            for term in terms
+        )
+        super().__init__(value, config=config, search_type="raw")
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Search filter matching words of the fields by their prefixes
+
+    Unlike `icontains` it's served by a GIN index of the same search vector,
+    `SearchVector(*search_fields, config=search_config)`, and fits
+    autocomplete. Results are ordered by relevance unless an ordering is
+    requested, shorter documents are ranked higher.
+    """
+
+    search_config = "simple"
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        query = PrefixSearchQuery(search_terms, config=self.search_config)
+        queryset = (
+            queryset.annotate(
+                search_vector=SearchVector(
+                    *search_fields, config=self.search_config
+                )
+            )
+            .filter(search_vector=query)
+            .annotate(
+                search_relevance=SearchRank(
+                    F("search_vector"), query, normalization=1
+                )
+            )
+        )
+
+        if api_settings.ORDERING_PARAM in request.query_params:
+            return queryset
+        return queryset.order_by("-search_relevance", "-pk")
+
+
+class MessageSearch:
+    """
+    Search of the messages of the given chats, newest first
+
+    Messages are looked up in `MessageDocument` when Elasticsearch is
+    enabled and in the GIN index of the same search vector otherwise. Both
+    sort the hits by `(created_at, id)` and continue after the key of the
+    last hit, so a page deep in the history costs as much as the first one.
+    Every message comes with a `highlight` snippet of its text.
+    """
+
+    search_config = "simple"
+    pre_tag = "<mark>"
+    post_tag = "</mark>"
+    fragment_size = 150
+
+    def __init__(self, queryset, chat_ids, terms):
+        self.queryset = queryset.filter(chat__in=chat_ids)
+        self.chat_ids = chat_ids
+        self.terms = terms
+
+    def __call__(self, before, size):
+        """Search a page of the messages
+
+        Args:
+            before: key of the last hit of the previous page or None
+            size: number of the messages
+
+        Returns:
+            tuple: messages and the key of the last one if there are more
+        """
+        if not self.chat_ids or not self.terms:
+            return [], None
+        if settings.ELASTICSEARCH_ENABLED:
+            return self.search_document(before, size)
+        return self.search_database(before, size)
+
+    def search_database(self, before, size):
+        query = PrefixSearchQuery(self.terms, config=self.search_config)
+        queryset = self.queryset.annotate(
+            search_vector=SearchVector("text", config=self.search_config)
+        ).filter(search_vector=query)
+        if before is not None:
+            created_at, pk = before
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, pk__lt=pk)
+            )
+
+        # Postgres computes the headlines after the limit
+        messages = list(
+            queryset.annotate(
+                highlight=SearchHeadline(
+                    "text",
+                    query,
+                    config=self.search_config,
+                    start_sel=self.pre_tag,
+                    stop_sel=self.post_tag,
+                )
+            ).order_by("-created_at", "-id")[: size + 1]
+        )
+        if len(messages) <= size:
+            return messages, None
+        del messages[size:]
+        return messages, (messages[-1].created_at, messages[-1].pk)
+
+    def search_document(self, before, size):
+        search = (
+            MessageDocument.search()
+            .filter("terms", chat=sorted(self.chat_ids))
+            .query(
+                "match_bool_prefix",
+                text={"query": " ".join(self.terms), "operator": "and"},
+            )
+            .sort({"created_at": "desc"}, {"id": "desc"})
+            .highlight(
+                "text",
+                number_of_fragments=1,
+                fragment_size=self.fragment_size,
+                no_match_size=self.fragment_size,
+                pre_tags=[self.pre_tag],
+                post_tags=[self.post_tag],
+            )
+            .source(False)
+            .extra(size=size + 1)
+        )
+        if before is not None:
+            created_at, pk = before
+            search = search.extra(
+                search_after=[int(created_at.timestamp() * 1000), pk]
+            )
+
+        hits = list(search.execute())
+        more = len(hits) > size
+        del hits[size:]
+
+        # Messages deleted since they were indexed are skipped
+        messages = self.queryset.in_bulk([int(hit.meta.id) for hit in hits])
+        page = []
+        for hit in hits:
+            message = messages.get(int(hit.meta.id))
+            if message is not None:
+                message.highlight = hit.meta.highlight.text[0]
+                page.append(message)
+
+        if not more:
+            return page, None
+        # Sort values of the date are milliseconds since the epoch
+        timestamp, pk = hits[-1].meta.sort
+        return page, (
+            datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc),
+            int(pk),
+        )
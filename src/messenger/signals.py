@@ -1,16 +1,119 @@
 import os
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from django.db.models.signals import post_delete, post_save
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
 from django.dispatch import receiver
+from django.utils import timezone
 
-from messenger.models import File, Message
+from messenger.api.v1.serializers import UserSerializer
+from messenger.cache import membership_cache
+from messenger.managers import invalidate_memberships
+from messenger.models import Chat, File, Membership, Message
+from messenger.websocket.events import get_message_event, send_events
+from server.cache import render_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Chat)
+def sync_creator_membership(sender, instance, **kwargs):  # noqa
+    """Keep the membership of the chat creator up to date
+
+    Args:
+        sender: sender of the signal
+        instance: instance of the model
+        kwargs: additional arguments
+    """
+    Membership.objects.sync(instance)
+
+
+@receiver(m2m_changed, sender=Chat.invited.through)
+def sync_invited_memberships(
+    sender, instance, action, reverse, pk_set, **kwargs
+):  # noqa
+    """Mirror changes of the invited users to the chat memberships
+
+    Args:
+        sender: sender of the signal
+        instance: chat or user instance, depends on the reverse
+        action: type of the update
+        reverse: boolean, True when the user side has been changed
+        pk_set: primary keys of the changed objects
+        kwargs: additional arguments
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        chats = (instance,)
+    elif pk_set is not None:
+        chats = Chat.objects.filter(pk__in=pk_set)
+    else:
+        chats = Chat.objects.filter(memberships__user=instance)
+
+    # Changed members change the rendered chat, so its validators as well
+    changed = [chat.pk for chat in chats if Membership.objects.sync(chat)]
+    if changed:
+        Chat.objects.filter(pk__in=changed).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Chat)
+def invalidate_chat_memberships(sender, instance, **kwargs):  # noqa
+    """Forget cached memberships of the members of a deleted chat
+
+    Args:
+        sender: sender of the signal
+        instance: instance of the model
+        kwargs: additional arguments
+    """
+    invalidate_memberships(
+        instance.memberships.values_list("user_id", flat=True)
+    )
+
+
+def clear_caches(sender, **kwargs):  # noqa
+    """Drop cached memberships and representations after the migrations
+
+    Only their own keys are deleted, the rest of the shared cache is kept.
+
+    Args:
+        sender: sender of the signal
+        kwargs: additional arguments
+    """
+    membership_cache.clear()
+    render_cache.clear()
+
+
+@receiver(post_save, sender=User)
+def bump_rendered_user(sender, instance, **kwargs):  # noqa
+    """Version the cached representation of a changed user anew
+
+    The version is bumped again after the commit, so a representation
+    rendered from the user read before the commit isn't served.
+
+    Args:
+        sender: sender of the signal
+        instance: instance of the model
+        kwargs: additional arguments
+    """
+    UserSerializer.bump_render_version((instance,))
+    transaction.on_commit(
+        lambda: UserSerializer.bump_render_version((instance,))
+    )
 
 
 @receiver(post_save, sender=Message)
 def send_message_to_ws(sender, instance, created, **kwargs):  # noqa
-    """Send message data to the WebSockets
+    """Send message data to the WebSockets once the message is committed
+
+    The event is written to the outbox, so it belongs to the transaction
+    the message is saved in, when there is one.
 
     Args:
         sender: sender of the signal
@@ -18,15 +121,21 @@ def send_message_to_ws(sender, instance, created, **kwargs):  # noqa
         created: boolean
         kwargs: additional arguments
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        str(instance.chat.id),
-        {
-            "type": "send_json",
-            "text": instance.text,
-            "created": created,
-            "id": instance.id,
-        },
+    send_events({str(instance.chat_id): get_message_event(instance, created)})
+
+
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def touch_file_message(sender, instance, **kwargs):  # noqa
+    """Mark the message as modified when its files are changed
+
+    Args:
+        sender: sender of the signal
+        instance: instance of the model
+        kwargs: additional arguments
+    """
+    Message.objects.filter(pk=instance.message_id).update(
+        updated_at=timezone.now()
     )
 
 
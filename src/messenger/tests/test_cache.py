@@ -0,0 +1,285 @@
+import threading
+import time
+import uuid
+from unittest.mock import Mock, patch
+
+import redis
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK
+from rest_framework.test import APITestCase
+
+from messenger.api.v1.serializers import ChatViewSerializer, UserSerializer
+from messenger.cache import MembershipCache, membership_cache
+from messenger.models import Chat
+from messenger.signals import clear_caches
+from messenger.tests.factory import ChatFactory, UserFactory
+from server.cache import (
+    LocalCache,
+    RedisCache,
+    get_or_compute,
+    is_expiring,
+    render_cache,
+)
+
+
+class LocalCacheTest(SimpleTestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = LocalCache(size=2, timeout=60)
+        cache.set("first", 1)
+        cache.set("second", 2)
+        cache.get("first")
+        cache.set("third", 3)
+
+        self.assertEqual(cache.get("first"), 1)
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("third"), 3)
+
+    def test_entry_expires(self):
+        cache = LocalCache(size=2, timeout=-1)
+        cache.set("first", 1)
+        self.assertIsNone(cache.get("first"))
+
+
+class RedisCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches["default"]
+        self.prefix = uuid.uuid4().hex
+
+    def test_values_round_trip(self):
+        key = f"{self.prefix}:value"
+        self.cache.set(key, {"id": 1, "ids": frozenset((1, 2))})
+        self.assertDictEqual(
+            self.cache.get(key), {"id": 1, "ids": frozenset((1, 2))}
+        )
+
+        self.assertFalse(self.cache.add(key, "other"))
+        self.cache.set_many({f"{self.prefix}:first": 1})
+        self.assertDictEqual(
+            self.cache.get_many((key, f"{self.prefix}:first")),
+            {
+                key: {"id": 1, "ids": frozenset((1, 2))},
+                f"{self.prefix}:first": 1,
+            },
+        )
+
+    def test_delete_pattern(self):
+        self.cache.set_many(
+            {f"{self.prefix}:first": 1, f"{self.prefix}:second": 2}
+        )
+        self.cache.delete_pattern(f"{self.prefix}:*")
+        self.assertDictEqual(
+            self.cache.get_many(
+                (f"{self.prefix}:first", f"{self.prefix}:second")
+            ),
+            {},
+        )
+
+
+class ClearCachesTest(SimpleTestCase):
+    def test_only_own_keys_are_cleared(self):
+        cache = caches["default"]
+        key = uuid.uuid4().hex
+        cache.set(key, 1)
+        self.addCleanup(cache.delete, key)
+        membership_cache.cache.set(membership_cache.make_key(0), frozenset())
+
+        clear_caches(sender=None)
+        self.assertEqual(cache.get(key), 1)
+        self.assertIsNone(
+            membership_cache.cache.get(membership_cache.make_key(0))
+        )
+
+
+class GetOrComputeTest(SimpleTestCase):
+    def setUp(self):
+        self.key = f"test:{uuid.uuid4().hex}"
+
+    def test_value_is_cached(self):
+        compute = Mock(return_value=[1, 2])
+        for _ in range(2):
+            self.assertListEqual(
+                get_or_compute(self.key, compute, timeout=60), [1, 2]
+            )
+        compute.assert_called_once()
+
+    def test_missing_value_is_computed_once(self):
+        def compute():
+            time.sleep(0.2)
+            return "value"
+
+        compute = Mock(side_effect=compute)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    get_or_compute(self.key, compute, timeout=60)
+                )
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual(results, ["value"] * 5)
+        compute.assert_called_once()
+
+    def test_stale_value_is_served_while_computed_elsewhere(self):
+        caches["default"].set(self.key, ("old", 1, time.time() + 1))
+        caches["default"].add(f"{self.key}:lock", True)
+        self.addCleanup(caches["default"].delete, f"{self.key}:lock")
+
+        compute = Mock(return_value="new")
+        with patch("server.cache.is_expiring", return_value=True):
+            self.assertEqual(
+                get_or_compute(self.key, compute, timeout=60), "old"
+            )
+        compute.assert_not_called()
+
+    def test_value_is_computed_without_shared_cache(self):
+        shared = caches["default"]
+        compute = Mock(return_value="value")
+        with patch.object(shared, "get", side_effect=redis.RedisError):
+            with patch.object(shared, "add", side_effect=redis.RedisError):
+                with patch("server.cache.time.sleep") as sleep:
+                    with self.assertLogs("server.cache", level="WARNING"):
+                        self.assertEqual(
+                            get_or_compute(self.key, compute, timeout=60),
+                            "value",
+                        )
+        sleep.assert_not_called()
+        compute.assert_called_once()
+
+    def test_value_is_returned_when_lock_is_not_released(self):
+        self.addCleanup(caches["default"].delete, f"{self.key}:lock")
+        compute = Mock(return_value="value")
+        with patch.object(
+            caches["default"], "delete", side_effect=redis.RedisError
+        ), self.assertLogs("server.cache", level="WARNING"):
+            self.assertEqual(
+                get_or_compute(self.key, compute, timeout=60), "value"
+            )
+
+    def test_expiring_value_is_recomputed_early(self):
+        now = time.time()
+        with patch("server.cache.random.random", return_value=0.5):
+            # The gap is about 0.7 of the computation time
+            self.assertTrue(is_expiring(("value", 10, now + 5), beta=1))
+            self.assertFalse(is_expiring(("value", 1, now + 5), beta=1))
+            self.assertFalse(is_expiring(("value", 10, now + 5), beta=0))
+
+
+class MembershipCacheTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.chat = ChatFactory(creator=self.user)
+
+    def test_memberships_are_cached(self):
+        self.assertSetEqual(
+            membership_cache.get_chat_ids(self.user.id), {self.chat.id}
+        )
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                membership_cache.is_member(self.user.id, self.chat.id)
+            )
+
+    def test_redis_level_is_shared(self):
+        membership_cache.get_chat_ids(self.user.id)
+
+        other_process = MembershipCache(settings.MEMBERSHIP_CACHE)
+        with self.assertNumQueries(0):
+            self.assertSetEqual(
+                other_process.get_chat_ids(self.user.id), {self.chat.id}
+            )
+
+    def test_invalidated_by_invited(self):
+        user = UserFactory()
+        self.assertFalse(membership_cache.is_member(user.id, self.chat.id))
+
+        self.chat.invited.add(user)
+        self.assertTrue(membership_cache.is_member(user.id, self.chat.id))
+
+        user.invited.remove(self.chat)
+        self.assertFalse(membership_cache.is_member(user.id, self.chat.id))
+
+    def test_invalidated_by_chat_delete(self):
+        self.assertTrue(membership_cache.is_member(self.user.id, self.chat.id))
+
+        self.chat.delete()
+        self.assertSetEqual(membership_cache.get_chat_ids(self.user.id), set())
+
+    def test_redis_unavailable(self):
+        cache = MembershipCache(settings.MEMBERSHIP_CACHE)
+        unavailable = RedisCache(
+            "redis://127.0.0.1:1/0", {"OPTIONS": {"socket_timeout": 0.5}}
+        )
+        with patch.object(
+            MembershipCache, "cache", unavailable
+        ), self.assertLogs("server.cache", level="WARNING"):
+            self.assertSetEqual(
+                cache.get_chat_ids(self.user.id), {self.chat.id}
+            )
+
+
+class RenderCacheTest(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.invited = UserFactory()
+        ChatFactory.create_batch(
+            size=3, creator=self.user, invited=[self.invited]
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def get_chats(self):
+        response = self.client.get(reverse("messenger:chat-list"))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return response.json()["results"]
+
+    def test_page_is_assembled_from_cached_fragments(self):
+        chats = self.get_chats()
+
+        with patch.object(
+            render_cache, "get_many", wraps=render_cache.get_many
+        ) as get_many, patch.object(
+            ChatViewSerializer, "render_fragment"
+        ) as render_fragment:
+            self.assertListEqual(self.get_chats(), chats)
+
+        # One MGET for the chats and one for all of their users
+        self.assertEqual(get_many.call_count, 2)
+        render_fragment.assert_not_called()
+
+    def test_changed_user_is_rendered_again(self):
+        self.get_chats()
+        self.invited.first_name = "Changed"
+        self.invited.save()
+
+        for chat in self.get_chats():
+            self.assertEqual(chat["invited"][0]["first_name"], "Changed")
+
+    def test_stale_user_is_not_served(self):
+        self.get_chats()
+        key = UserSerializer().get_render_keys([self.invited])[0]
+        self.invited.first_name = "Changed"
+        self.invited.save()
+
+        # Written back by a request which rendered the user before saving
+        render_cache.set_many(
+            {key: {**UserSerializer(self.invited).data, "first_name": "Old"}}
+        )
+        for chat in self.get_chats():
+            self.assertEqual(chat["invited"][0]["first_name"], "Changed")
+
+    def test_changed_chat_is_rendered_again(self):
+        chat = Chat.objects.filter(creator=self.user).first()
+        self.get_chats()
+        chat.title = "Changed"
+        chat.save()
+
+        self.assertIn("Changed", [chat["title"] for chat in self.get_chats()])
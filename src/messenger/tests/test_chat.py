@@ -1,14 +1,30 @@
+import asyncio
+import json
 import os
-from unittest import skipIf
+import time
+import uuid
+import zlib
+from unittest import skipIf, skipUnless
+from unittest.mock import patch
 
+import msgpack
 from asgiref.sync import sync_to_async
 from channels.testing import WebsocketCommunicator
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.exceptions import AuthenticationFailed
-from rest_framework.status import HTTP_200_OK
+from freezegun import freeze_time
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_404_NOT_FOUND,
+)
 from rest_framework.test import APITestCase
 
+from messenger.cache import MembershipCache
+from messenger.models import Message
+from messenger.pagination import EstimatedCountPagination
 from messenger.tests import (
     DeleteWithoutTokenMixin,
     GetWithoutTokenMixin,
@@ -16,6 +32,13 @@ from messenger.tests import (
     PutWithoutTokenMixin,
 )
 from messenger.tests.factory import ChatFactory, MessageFactory, UserFactory
+from messenger.websocket.batching import (
+    MessageRejected,
+    insert_messages,
+    save_messages,
+)
+from messenger.websocket.consumers import CLOSE_FORBIDDEN, CLOSE_UNAUTHORIZED
+from messenger.websocket.frames import JSON_DEFLATE, MSGPACK
 from messenger.websocket.handler import get_ws_application
 
 
@@ -34,8 +57,367 @@ class GetChatViewTest(GetWithoutTokenMixin, APITestCase):
         )
         self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(response.json()["count"], 25)
+        self.assertFalse(response.json()["count_is_estimate"])
+        self.assertTrue(response.json()["has_next"])
         self.assertEqual(len(response.json()["results"]), 20)
 
+    @skipUnless(connection.vendor == "postgresql", "Estimates need Postgres")
+    def test_get_chat_with_estimated_count(self):
+        user = UserFactory()
+        ChatFactory.create_batch(size=3, creator=user)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        with patch.object(
+            EstimatedCountPagination, "exact_count_threshold", 0
+        ):
+            response = self.client.get(reverse("messenger:chat-list"))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertTrue(response.json()["count_is_estimate"])
+        self.assertIsInstance(response.json()["count"], int)
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_get_chat_with_included_users(self):
+        user, invited = UserFactory(), UserFactory()
+        ChatFactory.create_batch(size=3, creator=user, invited=[invited])
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:chat-list"),
+            data={"include": "users"},
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(response.json()["results"][0]["creator"], user.id)
+        self.assertSetEqual(
+            set(response.json()["included"]["users"]),
+            {str(user.id), str(invited.id)},
+        )
+
+    def test_get_chat_as_invited_user(self):
+        user = UserFactory()
+        ChatFactory.create_batch(size=3, invited=[user, UserFactory()])
+        ChatFactory.create_batch(size=2)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:chat-list"),
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+
+    def test_get_chat_after_invited_user_removed(self):
+        user = UserFactory()
+        chat = ChatFactory(invited=[user])
+        chat.invited.remove(user)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:chat-list"),
+        )
+        self.assertEqual(response.json()["count"], 0)
+
+
+class SearchChatViewTest(GetWithoutTokenMixin, APITestCase):
+    url_name = "messenger:chat_search-list"
+
+    def test_search_chat_without_count(self):
+        user = UserFactory()
+        for index in range(3):
+            ChatFactory(title=f"python {index}")
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse(self.url_name), data={"search": "python", "limit": 2}
+            )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in context.captured_queries)
+        )
+        self.assertNotIn("count", response.json())
+        self.assertTrue(response.json()["has_next"])
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        response = self.client.get(response.json()["next"])
+        self.assertFalse(response.json()["has_next"])
+        self.assertIsNone(response.json()["next"])
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def search(self, **data):
+        user = UserFactory()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(reverse(self.url_name), data=data)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return [chat["title"] for chat in response.json()["results"]]
+
+    def test_search_by_word_prefix(self):
+        ChatFactory(title="python tips")
+        ChatFactory(title="java tips")
+
+        self.assertListEqual(self.search(search="pyth"), ["python tips"])
+        self.assertListEqual(self.search(search="o'reilly \\ & !"), [])
+
+    def test_search_ordered_by_relevance(self):
+        ChatFactory(title="python")
+        ChatFactory(title="pythonista guide")
+
+        self.assertListEqual(
+            self.search(search="python"), ["python", "pythonista guide"]
+        )
+        self.assertListEqual(
+            self.search(search="python", ordering="-created_at"),
+            ["pythonista guide", "python"],
+        )
+
+    def test_search_results_are_cached(self):
+        user = UserFactory()
+        ChatFactory(title="python")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+
+        response = self.client.get(
+            reverse(self.url_name), data={"search": "python"}
+        )
+        with self.assertNumQueries(0):
+            cached = self.client.get(
+                reverse(self.url_name), data={"search": "python"}
+            )
+        self.assertEqual(cached.json(), response.json())
+
+
+class MembershipTest(TestCase):
+    def test_membership_follows_creator_and_invited(self):
+        creator, invited, new_creator = UserFactory.create_batch(size=3)
+        chat = ChatFactory(creator=creator, invited=[invited])
+        self.assertSetEqual(
+            set(chat.memberships.values_list("user_id", flat=True)),
+            {creator.id, invited.id},
+        )
+
+        chat.creator = new_creator
+        chat.save()
+        invited.invited.clear()
+        self.assertSetEqual(
+            set(chat.memberships.values_list("user_id", flat=True)),
+            {new_creator.id},
+        )
+
+
+class UnreadChatViewTest(GetWithoutTokenMixin, APITestCase):
+    url_name = "messenger:chat-unread"
+
+    def setUp(self):
+        self.creator, self.invited = UserFactory(), UserFactory()
+        self.chat = ChatFactory(creator=self.creator, invited=[self.invited])
+        self.messages = MessageFactory.create_batch(
+            size=3, chat=self.chat, sender=self.creator
+        )
+        MessageFactory(chat=self.chat, sender=self.invited)
+
+    def get_unread_count(self, user):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(reverse("messenger:chat-unread"))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return {item["chat"]: item["unread_count"] for item in response.json()}
+
+    def mark_read(self, user, message):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.post(
+            reverse("messenger:chat-read", kwargs={"pk": self.chat.pk}),
+            data={"message": message.pk},
+        )
+        self.assertEqual(response.status_code, 204)
+
+    def test_get_unread_count(self):
+        self.assertDictEqual(
+            self.get_unread_count(self.invited), {self.chat.id: 3}
+        )
+        self.assertDictEqual(
+            self.get_unread_count(self.creator), {self.chat.id: 1}
+        )
+
+    def test_new_member_has_nothing_unread(self):
+        user = UserFactory()
+        self.chat.invited.add(user)
+        self.assertDictEqual(self.get_unread_count(user), {self.chat.id: 0})
+
+    def test_mark_read(self):
+        self.mark_read(self.invited, self.messages[1])
+        self.assertDictEqual(
+            self.get_unread_count(self.invited), {self.chat.id: 1}
+        )
+
+    def test_mark_read_never_moves_back(self):
+        self.mark_read(self.invited, self.messages[2])
+        self.mark_read(self.invited, self.messages[0])
+        self.assertDictEqual(
+            self.get_unread_count(self.invited), {self.chat.id: 0}
+        )
+
+    def test_mark_read_ignores_message_of_other_chat(self):
+        self.mark_read(self.invited, MessageFactory())
+        self.assertDictEqual(
+            self.get_unread_count(self.invited), {self.chat.id: 3}
+        )
+
+    def test_mark_read_survives_deleted_message(self):
+        self.mark_read(self.invited, self.messages[1])
+        self.messages[1].delete()
+        self.assertDictEqual(
+            self.get_unread_count(self.invited), {self.chat.id: 1}
+        )
+
+    def test_mark_read_of_not_my_chat(self):
+        user = UserFactory()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.post(
+            reverse("messenger:chat-read", kwargs={"pk": self.chat.pk}),
+            data={"message": self.messages[0].pk},
+        )
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetChatViewTest(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.chat = ChatFactory(creator=self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def get_chats(self, **headers):
+        return self.client.get(reverse("messenger:chat-list"), **headers)
+
+    def test_get_chat_not_modified(self):
+        response = self.get_chats()
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertIn("ETag", response)
+
+        # The page with its prefetches and count is loaded, but it isn't
+        # serialized; token and memberships are cached
+        with self.assertNumQueries(5):
+            response = self.get_chats(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+    def test_get_chat_modified_by_invited(self):
+        etag = self.get_chats()["ETag"]
+        self.chat.invited.add(UserFactory())
+
+        response = self.get_chats(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_get_chat_modified_on_page(self):
+        etag = self.get_chats()["ETag"]
+        self.chat.title = "renamed"
+        self.chat.save()
+
+        response = self.get_chats(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["results"][0]["title"], "renamed")
+
+    def test_get_chat_modified_by_creator(self):
+        etag = self.get_chats()["ETag"]
+        self.user.first_name = "Renamed"
+        self.user.save()
+
+        response = self.get_chats(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(
+            response.json()["results"][0]["creator"]["first_name"], "Renamed"
+        )
+
+    def test_get_chat_modified_by_delete(self):
+        ChatFactory(creator=self.user)
+        etag = self.get_chats()["ETag"]
+        self.chat.delete()
+
+        response = self.get_chats(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 1)
+
+
+class InboxChatViewTest(GetWithoutTokenMixin, APITestCase):
+    url_name = "messenger:chat-inbox"
+
+    def setUp(self):
+        self.user = UserFactory()
+        with freeze_time("2022-01-01"):
+            self.quiet_chat = ChatFactory(creator=self.user)
+        with freeze_time("2022-01-02"):
+            self.busy_chat = ChatFactory(invited=[self.user])
+        with freeze_time("2022-01-03"):
+            self.new_chat = ChatFactory(creator=self.user)
+        with freeze_time("2022-01-04"):
+            MessageFactory.create_batch(
+                size=2, chat=self.busy_chat, sender=self.busy_chat.creator
+            )
+            self.last_message = MessageFactory(
+                chat=self.busy_chat, sender=self.busy_chat.creator
+            )
+        ChatFactory()
+
+    def get_inbox(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+        return self.client.get(reverse(self.url_name))
+
+    def test_get_inbox(self):
+        self.get_inbox()
+
+        # The page and its latest messages, token and memberships come
+        # from the caches
+        with self.assertNumQueries(2):
+            response = self.get_inbox()
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+        results = response.json()["results"]
+        self.assertListEqual(
+            [chat["id"] for chat in results],
+            [self.busy_chat.id, self.new_chat.id, self.quiet_chat.id],
+        )
+        self.assertDictEqual(
+            results[0]["last_message"],
+            {
+                "id": self.last_message.id,
+                "text": self.last_message.text,
+                "sender": self.busy_chat.creator_id,
+                "created_at": "2022-01-04T00:00:00Z",
+            },
+        )
+        self.assertEqual(results[0]["unread_count"], 3)
+        self.assertIsNone(results[1]["last_message"])
+        self.assertEqual(results[1]["unread_count"], 0)
+
+    def test_get_inbox_after_read(self):
+        self.busy_chat.memberships.filter(user=self.user).update(
+            last_read_message=self.last_message
+        )
+        response = self.get_inbox()
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["results"][0]["unread_count"], 0)
+
 
 class AddChatViewTest(PostWithoutTokenMixin, APITestCase):
     url_name = "messenger:chat-list"
@@ -96,7 +478,7 @@ class EditChatViewTest(PutWithoutTokenMixin, APITestCase):
 @skipIf(
     os.getenv("DEPLOYMENT_ARCHITECTURE") == "test", "Don't check in CI/CD flow"
 )
-class ChatConsumerTest(TestCase):
+class ChatConsumerTest(TransactionTestCase):
     @sync_to_async
     def create_message(self, chat=None):
         if chat:
@@ -123,5 +505,361 @@ class ChatConsumerTest(TestCase):
             application=get_ws_application(),
             path=f"/ws/chat/{self.message.chat.id}",
         )
-        with self.assertRaises(AuthenticationFailed):
-            await communicator.connect()
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, CLOSE_UNAUTHORIZED)
+
+    async def test_check_if_token_invalid(self):
+        await self.create_message()
+        communicator = WebsocketCommunicator(
+            application=get_ws_application(),
+            path=f"/ws/chat/{self.message.chat.id}?token=12345",
+        )
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, CLOSE_UNAUTHORIZED)
+
+    async def test_reject_not_member(self):
+        await self.create_message()
+        user = await sync_to_async(UserFactory)()
+        communicator = WebsocketCommunicator(
+            application=get_ws_application(),
+            path=f"/ws/chat/{self.message.chat.id}?"
+            f"token={user.auth_token.key}",
+        )
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, CLOSE_FORBIDDEN)
+
+    async def test_close_when_removed_from_chat(self):
+        user = await sync_to_async(UserFactory)()
+        chat = await sync_to_async(ChatFactory)(invited=[user])
+        communicator = WebsocketCommunicator(
+            application=get_ws_application(),
+            path=f"/ws/chat/{chat.id}?token={user.auth_token.key}",
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await sync_to_async(chat.invited.remove)(user)
+        self.assertDictEqual(
+            await communicator.receive_output(),
+            {"type": "websocket.close", "code": CLOSE_FORBIDDEN},
+        )
+
+    async def test_concurrent_connects(self):
+        await self.create_message()
+        path = (
+            f"/ws/chat/{self.message.chat.id}?"
+            f"token={self.message.chat.creator.auth_token.key}"
+        )
+        communicators = [
+            WebsocketCommunicator(application=get_ws_application(), path=path)
+            for _ in range(50)
+        ]
+
+        with patch.object(
+            MembershipCache,
+            "load",
+            autospec=True,
+            side_effect=MembershipCache.load,
+        ) as load:
+            started = time.perf_counter()
+            results = await asyncio.gather(
+                *(communicator.connect() for communicator in communicators)
+            )
+            elapsed = time.perf_counter() - started
+
+        self.assertTrue(all(connected for connected, _ in results))
+        # Memberships of the user are looked up once for all connections
+        self.assertEqual(load.call_count, 1)
+        self.assertLess(elapsed / len(communicators), 0.1)
+        await asyncio.gather(
+            *(communicator.disconnect() for communicator in communicators)
+        )
+
+
+@skipIf(
+    os.getenv("DEPLOYMENT_ARCHITECTURE") == "test", "Don't check in CI/CD flow"
+)
+class UserConsumerTest(TransactionTestCase):
+    @sync_to_async
+    def create_chats(self):
+        self.user = UserFactory()
+        self.chats = [
+            ChatFactory(creator=self.user),
+            ChatFactory(invited=[self.user]),
+        ]
+
+    async def connect(self, token=None):
+        communicator = WebsocketCommunicator(
+            application=get_ws_application(),
+            path=f"/ws/user?token={token or self.user.auth_token.key}",
+        )
+        return communicator, await communicator.connect()
+
+    async def test_events_of_all_chats(self):
+        await self.create_chats()
+        communicator, (connected, _) = await self.connect()
+        self.assertTrue(connected)
+
+        for chat in self.chats:
+            message = await sync_to_async(MessageFactory)(chat=chat)
+            event = await communicator.receive_json_from()
+            self.assertEqual(
+                (event["chat"], event["id"]), (chat.id, message.id)
+            )
+        await communicator.disconnect()
+
+    async def test_follows_joined_and_left_chats(self):
+        await self.create_chats()
+        communicator, _ = await self.connect()
+        chat = await sync_to_async(ChatFactory)()
+
+        await sync_to_async(chat.invited.add)(self.user)
+        self.assertDictEqual(
+            await communicator.receive_json_from(),
+            {"type": "chats", "joined": [chat.id], "left": []},
+        )
+        message = await sync_to_async(MessageFactory)(chat=chat)
+        self.assertEqual(
+            (await communicator.receive_json_from())["id"], message.id
+        )
+
+        await sync_to_async(self.chats[1].invited.remove)(self.user)
+        self.assertDictEqual(
+            await communicator.receive_json_from(),
+            {"type": "chats", "joined": [], "left": [self.chats[1].id]},
+        )
+        await sync_to_async(MessageFactory)(chat=self.chats[1])
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_reject_anonymous(self):
+        await self.create_chats()
+        _, (connected, code) = await self.connect(token="12345")
+        self.assertFalse(connected)
+        self.assertEqual(code, CLOSE_UNAUTHORIZED)
+
+
+@skipIf(
+    os.getenv("DEPLOYMENT_ARCHITECTURE") == "test", "Don't check in CI/CD flow"
+)
+class MessageSendConsumerTest(TransactionTestCase):
+    @sync_to_async
+    def create_chat(self):
+        self.user = UserFactory()
+        self.chat = ChatFactory(creator=self.user)
+
+    async def connect(self, path=None):
+        communicator = WebsocketCommunicator(
+            application=get_ws_application(),
+            path=f"{path or '/ws/user'}?token={self.user.auth_token.key}",
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive(self, communicator, event_type):
+        while True:
+            event = await communicator.receive_json_from()
+            if event.get("type") == event_type:
+                return event
+
+    async def test_send_message(self):
+        await self.create_chat()
+        communicator = await self.connect(f"/ws/chat/{self.chat.id}")
+        client_id = str(uuid.uuid4())
+
+        await communicator.send_json_to(
+            {"type": "message.send", "client_id": client_id, "text": "hi"}
+        )
+        ack = await self.receive(communicator, "message.ack")
+        self.assertEqual(ack["client_id"], client_id)
+        self.assertEqual(ack["chat"], self.chat.id)
+
+        # A resent message is acknowledged with the saved one
+        await communicator.send_json_to(
+            {"type": "message.send", "client_id": client_id, "text": "hi"}
+        )
+        self.assertEqual(
+            (await self.receive(communicator, "message.ack"))["id"], ack["id"]
+        )
+        messages = await sync_to_async(list)(
+            Message.objects.filter(chat=self.chat).values_list(
+                "id", "sender", "text"
+            )
+        )
+        self.assertListEqual(messages, [(ack["id"], self.user.id, "hi")])
+        await communicator.disconnect()
+
+    async def test_send_message_to_foreign_chat(self):
+        await self.create_chat()
+        chat = await sync_to_async(ChatFactory)()
+        communicator = await self.connect()
+
+        await communicator.send_json_to(
+            {
+                "type": "message.send",
+                "client_id": str(uuid.uuid4()),
+                "chat": chat.id,
+                "text": "hi",
+            }
+        )
+        error = await communicator.receive_json_from()
+        self.assertEqual(error["type"], "message.error")
+        self.assertIn("chat", error["errors"])
+
+        await communicator.send_json_to({"type": "message.send"})
+        error = await communicator.receive_json_from()
+        self.assertSetEqual(
+            set(error["errors"]), {"client_id", "chat", "text"}
+        )
+        await communicator.disconnect()
+
+    def test_save_messages_to_deleted_chats(self):
+        user = UserFactory()
+        chats = ChatFactory.create_batch(size=3, creator=user)
+        messages = [
+            Message(
+                sender=user, chat_id=chat.id, text="hi", client_id=uuid.uuid4()
+            )
+            for chat in chats
+        ]
+        chats[2].delete()
+
+        def delete_chat_first(batch):
+            # Deleted after the batch has been validated
+            if len(batch) == 2:
+                chats[1].delete()
+            return insert_messages(batch)
+
+        with patch(
+            "messenger.websocket.batching.insert_messages",
+            side_effect=delete_chat_first,
+        ):
+            saved, deleted, missing = save_messages(messages)
+
+        self.assertEqual(saved.text, "hi")
+        self.assertIsNotNone(saved.pk)
+        self.assertIsInstance(deleted, MessageRejected)
+        self.assertDictEqual(
+            missing.errors, {"chat": ["Chat does not exist."]}
+        )
+        self.assertListEqual(
+            list(Message.objects.values_list("pk", flat=True)), [saved.pk]
+        )
+
+    async def test_concurrent_sends_are_batched(self):
+        await self.create_chat()
+        communicators = [await self.connect() for _ in range(5)]
+
+        with patch(
+            "messenger.websocket.batching.save_messages",
+            side_effect=save_messages,
+        ) as save:
+            await asyncio.gather(
+                *(
+                    communicator.send_json_to(
+                        {
+                            "type": "message.send",
+                            "client_id": str(uuid.uuid4()),
+                            "chat": self.chat.id,
+                            "text": f"message {index}",
+                        }
+                    )
+                    for communicator in communicators
+                    for index in range(20)
+                )
+            )
+            acks = [
+                await self.receive(communicator, "message.ack")
+                for communicator in communicators
+                for _ in range(20)
+            ]
+
+        self.assertEqual(len({ack["id"] for ack in acks}), 100)
+        self.assertLess(save.call_count, 100)
+        self.assertEqual(
+            await sync_to_async(Message.objects.count)(), len(acks)
+        )
+        for communicator in communicators:
+            await communicator.disconnect()
+
+
+@skipIf(
+    os.getenv("DEPLOYMENT_ARCHITECTURE") == "test", "Don't check in CI/CD flow"
+)
+class FrameFormatConsumerTest(TransactionTestCase):
+    @sync_to_async
+    def create_chat(self):
+        self.user = UserFactory()
+        self.chat = ChatFactory(creator=self.user)
+
+    async def connect(self, subprotocols):
+        communicator = WebsocketCommunicator(
+            application=get_ws_application(),
+            path=f"/ws/user?token={self.user.auth_token.key}",
+            subprotocols=subprotocols,
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, subprotocol
+
+    async def test_msgpack_frames(self):
+        await self.create_chat()
+        communicator, subprotocol = await self.connect(["v2", MSGPACK])
+        self.assertEqual(subprotocol, MSGPACK)
+
+        message = await sync_to_async(MessageFactory)(chat=self.chat)
+        event = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(
+            (event["chat"], event["id"]), (self.chat.id, message.id)
+        )
+
+        client_id = str(uuid.uuid4())
+        await communicator.send_to(
+            bytes_data=msgpack.packb(
+                {
+                    "type": "message.send",
+                    "client_id": client_id,
+                    "chat": self.chat.id,
+                    "text": "hi",
+                }
+            )
+        )
+        while True:
+            ack = msgpack.unpackb(await communicator.receive_from())
+            if ack["type"] == "message.ack":
+                break
+        self.assertEqual(ack["client_id"], client_id)
+        await communicator.disconnect()
+
+    async def test_large_frames_are_compressed(self):
+        await self.create_chat()
+        communicator, _ = await self.connect([JSON_DEFLATE])
+
+        await sync_to_async(MessageFactory)(chat=self.chat, text="short")
+        self.assertEqual(
+            json.loads(await communicator.receive_from())["text"], "short"
+        )
+
+        text = "long " * 1000
+        await sync_to_async(MessageFactory)(chat=self.chat, text=text)
+        frame = await communicator.receive_from()
+        self.assertIsInstance(frame, bytes)
+        self.assertLess(len(frame), len(text))
+        self.assertEqual(json.loads(zlib.decompress(frame))["text"], text)
+        await communicator.disconnect()
+
+    async def test_json_without_subprotocol(self):
+        await self.create_chat()
+        communicator, subprotocol = await self.connect(["v2"])
+        self.assertIsNone(subprotocol)
+
+        await communicator.send_to(bytes_data=b"\x78garbage")
+        self.assertDictEqual(
+            await communicator.receive_json_from(),
+            {"type": "error", "detail": "Invalid frame"},
+        )
+        await communicator.disconnect()
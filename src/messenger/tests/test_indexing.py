@@ -0,0 +1,360 @@
+import io
+import json
+import uuid
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, NotFoundError
+from elasticsearch_dsl.connections import connections
+from rest_framework.status import HTTP_201_CREATED
+from rest_framework.test import APITestCase
+
+from messenger.documents import MessageDocument
+from messenger.indexing import Reindex, indexing_queue, process_queue
+from messenger.models import Message
+from messenger.tests.factory import ChatFactory, MessageFactory, UserFactory
+
+
+class FakeElasticsearch(Elasticsearch):
+    """
+    Stand-in for Elasticsearch recording the bulk requests
+
+    Indices are kept in `aliases`, their names mapped to their aliases.
+    """
+
+    def __init__(self, failures=0):
+        super().__init__(hosts=["127.0.0.1:1"])
+        self.transport.perform_request = self.perform_request
+        self.failures = failures
+        self.bulks = []
+        self.searches = []
+        self.hits = []
+        self.aliases = {}
+
+    def perform_request(self, method, url, params=None, body=None, **kwargs):
+        name, *path = url.strip("/").split("/")
+        if method == "PUT" and not path:
+            self.aliases[name] = set()
+        elif path == ["_alias"]:
+            found = {
+                index: {"aliases": {alias: {} for alias in aliases}}
+                for index, aliases in self.aliases.items()
+                if name == index or name in aliases
+            }
+            if not found:
+                raise NotFoundError(404, "index_not_found_exception", {})
+            return found
+        elif name == "_aliases":
+            for action in body["actions"]:
+                ((op_type, options),) = action.items()
+                if op_type == "add":
+                    self.aliases[options["index"]].add(options["alias"])
+                elif op_type == "remove_index":
+                    del self.aliases[options["index"]]
+        return {"acknowledged": True}
+
+    def bulk(self, body, *args, **kwargs):  # noqa
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("N/A", "Elasticsearch is unavailable", None)
+
+        lines = iter(json.loads(line) for line in body.splitlines() if line)
+        actions = []
+        for line in lines:
+            ((op_type, meta),) = line.items()
+            source = next(lines) if op_type != "delete" else None
+            actions.append((op_type, meta["_index"], meta["_id"], source))
+        self.bulks.append(actions)
+
+        return {
+            "took": 1,
+            "errors": False,
+            "items": [
+                {op_type: {"_index": index, "_id": pk, "status": 200}}
+                for op_type, index, pk, _ in actions
+            ],
+        }
+
+    def search(self, **body):  # noqa
+        self.searches.append(body)
+        hits = self.hits[: body["size"]]
+        return {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(self.hits), "relation": "eq"},
+                "max_score": None,
+                "hits": [
+                    {
+                        "_index": "messages",
+                        "_id": str(pk),
+                        "_score": None,
+                        "sort": sort,
+                        "highlight": {"text": [highlight]},
+                    }
+                    for pk, sort, highlight in hits
+                ],
+            },
+        }
+
+
+@override_settings(ELASTICSEARCH_ENABLED=True)
+class IndexingTest(APITestCase):
+    def setUp(self):
+        # Apart from the queue of the running indexer
+        key = f"{settings.INDEXING_QUEUE['KEY']}:test:{uuid.uuid4().hex}"
+        self.queue_settings = override_settings(
+            INDEXING_QUEUE={**settings.INDEXING_QUEUE, "KEY": key}
+        )
+        self.queue_settings.enable()
+        self.addCleanup(self.queue_settings.disable)
+        self.addCleanup(self.delete_queue_keys)
+
+        self.elasticsearch = FakeElasticsearch()
+        connections.add_connection("default", self.elasticsearch)
+        self.addCleanup(connections.configure, **settings.ELASTICSEARCH_DSL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chat = ChatFactory()
+        indexing_queue.client.delete(indexing_queue.key)
+
+    def delete_queue_keys(self):
+        client = indexing_queue.client
+        keys = list(client.scan_iter(match=f"{indexing_queue.key}*"))
+        if keys:
+            client.delete(*keys)
+
+    def get_actions(self, index):
+        return [
+            action
+            for bulk in self.elasticsearch.bulks
+            for action in bulk
+            if action[1] == index
+        ]
+
+    def test_changes_are_indexed_in_bulk(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            messages = MessageFactory.create_batch(
+                size=3, chat=self.chat, sender=self.chat.creator
+            )
+        self.assertEqual(len(indexing_queue), 3)
+        self.assertListEqual(self.elasticsearch.bulks, [])
+
+        self.assertEqual(process_queue(), (3, 0))
+        self.assertEqual(len(indexing_queue), 0)
+
+        actions = self.get_actions("messages")
+        self.assertEqual(len(self.elasticsearch.bulks), 1)
+        self.assertSetEqual(
+            {(op_type, pk) for op_type, _, pk, _ in actions},
+            {("index", message.pk) for message in messages},
+        )
+        self.assertDictEqual(
+            actions[0][3],
+            {
+                "id": messages[0].pk,
+                "text": messages[0].text,
+                "status": messages[0].status,
+                "chat": self.chat.pk,
+                "sender": self.chat.creator_id,
+                "created_at": messages[0].created_at.isoformat(),
+                "updated_at": messages[0].updated_at.isoformat(),
+            },
+        )
+
+    def test_deleted_objects_are_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = MessageFactory(chat=self.chat, sender=self.chat.creator)
+            pk = message.pk
+            message.delete()
+
+        process_queue()
+        self.assertListEqual(
+            self.get_actions("messages"), [("delete", "messages", pk, None)]
+        )
+
+    def test_chat_members_follow_invited(self):
+        user = UserFactory()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.invited.add(self.chat)
+
+        process_queue()
+        ((_, _, pk, source),) = self.get_actions("chats")
+        self.assertEqual(pk, self.chat.pk)
+        self.assertCountEqual(
+            source["members"], [self.chat.creator_id, user.pk]
+        )
+
+    def test_failed_batch_is_retried(self):
+        self.elasticsearch.failures = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            MessageFactory(chat=self.chat, sender=self.chat.creator)
+
+        with self.settings(
+            INDEXING_QUEUE={**settings.INDEXING_QUEUE, "MAX_ATTEMPTS": 2}
+        ):
+            with self.assertLogs("messenger.indexing", level="WARNING"):
+                self.assertEqual(process_queue(), (1, 1))
+            self.assertEqual(len(indexing_queue), 1)
+
+            with self.assertLogs("messenger.indexing", level="ERROR"):
+                self.assertEqual(process_queue(), (1, 1))
+            self.assertEqual(len(indexing_queue), 0)
+
+    def test_batch_of_crashed_worker_is_recovered(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MessageFactory.create_batch(
+                size=2, chat=self.chat, sender=self.chat.creator
+            )
+
+        with patch(
+            "messenger.indexing.index_batch", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            process_queue()
+        self.assertEqual(len(indexing_queue), 0)
+
+        self.assertEqual(indexing_queue.recover(), 2)
+        self.assertEqual(process_queue(), (2, 0))
+        self.assertEqual(
+            indexing_queue.client.llen(indexing_queue.processing_key), 0
+        )
+
+    @override_settings(ELASTICSEARCH_ENABLED=False)
+    def test_disabled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MessageFactory(chat=self.chat, sender=self.chat.creator)
+        self.assertEqual(len(indexing_queue), 0)
+
+    def test_bulk_created_messages_are_queued(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.chat.creator.auth_token.key}"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("messenger:message-bulk"),
+                data=[
+                    {
+                        "sender": self.chat.creator_id,
+                        "chat": self.chat.pk,
+                        "text": "bulk",
+                    }
+                ]
+                * 2,
+                format="json",
+            )
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        self.assertEqual(len(indexing_queue), 2)
+        self.assertEqual(Message.objects.filter(text="bulk").count(), 2)
+
+    def test_search_messages_in_index(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.chat.creator.auth_token.key}"
+        )
+        messages = MessageFactory.create_batch(
+            size=3, chat=self.chat, sender=self.chat.creator
+        )
+        self.elasticsearch.hits = [
+            (message.pk, [1640995200000 - index, message.pk], "<mark>a</mark>")
+            for index, message in enumerate(reversed(messages))
+        ]
+        deleted_pk = messages[1].pk
+        messages[1].delete()
+
+        response = self.client.get(
+            reverse("messenger:message-search"),
+            data={"search": "a", "limit": 2, "format": "json"},
+        )
+        self.assertListEqual(
+            [
+                (result["id"], result["highlight"])
+                for result in response.json()["results"]
+            ],
+            [(messages[2].pk, "<mark>a</mark>")],
+        )
+        (body,) = self.elasticsearch.searches
+        self.assertIn(
+            {"terms": {"chat": [self.chat.pk]}},
+            body["query"]["bool"]["filter"],
+        )
+        self.assertEqual(body["size"], 3)
+
+        self.client.get(response.json()["next"])
+        self.assertListEqual(
+            self.elasticsearch.searches[1]["search_after"],
+            [1640995199999, deleted_pk],
+        )
+
+    def test_reindex_swaps_alias(self):
+        messages = MessageFactory.create_batch(
+            size=5, chat=self.chat, sender=self.chat.creator
+        )
+        self.elasticsearch.aliases = {"messages": set()}
+
+        index = Reindex(MessageDocument, chunk_size=2, workers=2).run()
+
+        self.assertDictEqual(self.elasticsearch.aliases, {index: {"messages"}})
+        self.assertEqual(len(self.elasticsearch.bulks), 3)
+        self.assertCountEqual(
+            [(op_type, pk) for op_type, _, pk, _ in self.get_actions(index)],
+            [("index", message.pk) for message in messages],
+        )
+        self.assertEqual(len(indexing_queue), 0)
+
+    def test_reindex_replays_deletes(self):
+        messages = MessageFactory.create_batch(
+            size=4, chat=self.chat, sender=self.chat.creator
+        )
+        deleted_pk = messages[0].pk
+
+        def delete_indexed(indexed):
+            if indexed == 2:
+                with self.captureOnCommitCallbacks(execute=True):
+                    messages[0].delete()
+                # The worker deletes it from the old index only
+                self.assertEqual(process_queue(), (1, 0))
+
+        Reindex(MessageDocument, chunk_size=2, workers=1).run(
+            progress=delete_indexed
+        )
+        self.elasticsearch.bulks.clear()
+
+        self.assertEqual(process_queue(), (1, 0))
+        self.assertListEqual(
+            self.get_actions("messages"),
+            [("delete", "messages", deleted_pk, None)],
+        )
+
+    def test_reindex_resumes_from_checkpoint(self):
+        messages = MessageFactory.create_batch(
+            size=5, chat=self.chat, sender=self.chat.creator
+        )
+
+        def interrupt(indexed):
+            raise KeyboardInterrupt
+
+        reindex = Reindex(MessageDocument, chunk_size=2, workers=1)
+        self.addCleanup(reindex.delete_checkpoint)
+        with self.assertRaises(KeyboardInterrupt):
+            reindex.run(progress=interrupt)
+        self.elasticsearch.bulks.clear()
+
+        index = reindex.run(resume=True)
+        self.assertListEqual(
+            sorted(pk for _, _, pk, _ in self.get_actions(index)),
+            [message.pk for message in messages[2:]],
+        )
+        self.assertDictEqual(self.elasticsearch.aliases, {index: {"messages"}})
+        self.assertIsNone(reindex.load_checkpoint())
+
+    def test_reindex_command(self):
+        MessageFactory(chat=self.chat, sender=self.chat.creator)
+        stdout = io.StringIO()
+
+        call_command("reindex", models=["messenger.Message"], stdout=stdout)
+
+        self.assertIn("messages: 1 documents", stdout.getvalue())
+        self.assertListEqual(self.get_actions("chats"), [])
@@ -1,15 +1,35 @@
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
 from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.status import HTTP_200_OK
+from freezegun import freeze_time
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
+    HTTP_404_NOT_FOUND,
+)
 from rest_framework.test import APITestCase
 
+from messenger.models import Message, OutboxEvent
 from messenger.tests import (
     DeleteWithoutTokenMixin,
     GetWithoutTokenMixin,
     PostWithoutTokenMixin,
     PutWithoutTokenMixin,
 )
-from messenger.tests.factory import ChatFactory, MessageFactory, UserFactory
+from messenger.tests.factory import (
+    ChatFactory,
+    FileFactory,
+    MessageFactory,
+    UserFactory,
+)
+from messenger.websocket.events import send_events
 
 User = get_user_model()
 
@@ -30,9 +50,202 @@ class GetMessageViewTest(GetWithoutTokenMixin, APITestCase):
             data={"chat": chat.id, "format": "json"},
         )
         self.assertEqual(response.status_code, HTTP_200_OK)
-        self.assertEqual(response.json()["count"], 25)
+        self.assertNotIn("count", response.json())
+        self.assertIsNone(response.json()["previous"])
         self.assertEqual(len(response.json()["results"]), 20)
 
+        next_page = self.client.get(response.json()["next"])
+        self.assertEqual(next_page.status_code, HTTP_200_OK)
+        self.assertIsNone(next_page.json()["next"])
+        self.assertEqual(len(next_page.json()["results"]), 5)
+
+        self.assertTrue(
+            {
+                message["id"] for message in response.json()["results"]
+            }.isdisjoint(
+                {message["id"] for message in next_page.json()["results"]}
+            )
+        )
+
+    def test_get_message_pages_with_same_created_at(self):
+        user = UserFactory()
+        chat = ChatFactory(creator=user)
+        with freeze_time("2022-01-01"):
+            messages = MessageFactory.create_batch(
+                size=5, chat=chat, sender=user
+            )
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"chat": chat.id, "limit": 2, "format": "json"},
+        )
+        received = [message["id"] for message in response.json()["results"]]
+        while response.json()["next"]:
+            response = self.client.get(response.json()["next"])
+            received += [
+                message["id"] for message in response.json()["results"]
+            ]
+
+        self.assertListEqual(
+            received,
+            sorted((message.id for message in messages), reverse=True),
+        )
+
+    def test_get_newer_messages(self):
+        user = UserFactory()
+        chat = ChatFactory(creator=user)
+        MessageFactory.create_batch(size=5, chat=chat, sender=user)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"chat": chat.id, "limit": 2, "format": "json"},
+        )
+        older_page = self.client.get(response.json()["next"])
+        newer_page = self.client.get(older_page.json()["previous"])
+
+        self.assertListEqual(
+            newer_page.json()["results"],
+            response.json()["results"],
+        )
+
+    def test_get_message_with_included(self):
+        user, invited = UserFactory(), UserFactory()
+        chat = ChatFactory(creator=user, invited=[invited])
+        MessageFactory.create_batch(size=3, chat=chat, sender=user)
+        MessageFactory.create_batch(size=2, chat=chat, sender=invited)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"chat": chat.id, "include": "users,chats", "format": "json"},
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertEqual(response.json()["results"][0]["chat"], chat.id)
+        self.assertListEqual(
+            list(response.json()["included"]["chats"]), [str(chat.id)]
+        )
+        self.assertListEqual(
+            response.json()["included"]["chats"][str(chat.id)]["invited"],
+            [invited.id],
+        )
+        self.assertSetEqual(
+            set(response.json()["included"]["users"]),
+            {str(user.id), str(invited.id)},
+        )
+
+    def test_get_message_with_included_users_only(self):
+        user = UserFactory()
+        chat = ChatFactory(creator=user, invited=UserFactory.create_batch(3))
+        MessageFactory.create_batch(size=2, chat=chat, sender=user)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"chat": chat.id, "include": "users", "format": "json"},
+        )
+        self.assertNotIn("chats", response.json()["included"])
+        self.assertListEqual(
+            list(response.json()["included"]["users"]), [str(user.id)]
+        )
+
+    def test_get_message_with_sparse_fields(self):
+        user = UserFactory()
+        chat = ChatFactory(creator=user, invited=UserFactory.create_batch(3))
+        MessageFactory.create_batch(size=3, chat=chat, sender=user)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("messenger:message-list"),
+                data={
+                    "chat": chat.id,
+                    "fields": "id,sender",
+                    "format": "json",
+                },
+            )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertListEqual(
+            [list(message) for message in response.json()["results"]],
+            [["id", "sender"]] * 3,
+        )
+
+        # Besides the aggregate of the conditional GET validators
+        message_queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if '"messenger_message"' in query["sql"]
+            and "MAX(" not in query["sql"]
+        ]
+        self.assertEqual(len(message_queries), 1)
+        self.assertNotIn('"messenger_message"."text"', message_queries[0])
+        self.assertFalse(
+            any(
+                "messenger_chat_invited" in query["sql"]
+                or "messenger_file" in query["sql"]
+                for query in context.captured_queries
+            )
+        )
+
+    def test_get_message_with_excluded_fields(self):
+        user = UserFactory()
+        chat = ChatFactory(creator=user)
+        MessageFactory(chat=chat, sender=user)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"chat": chat.id, "exclude": "chat,file_set"},
+        )
+        self.assertSetEqual(
+            set(response.json()["results"][0]),
+            {"id", "sender", "text", "status", "created_at", "updated_at"},
+        )
+
+    def test_get_message_with_invalid_cursor(self):
+        user = UserFactory()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"before": "invalid", "format": "json"},
+        )
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    def test_get_message_with_both_cursors(self):
+        user = UserFactory()
+        chat = ChatFactory(creator=user)
+        MessageFactory.create_batch(size=3, chat=chat, sender=user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"chat": chat.id, "limit": 1, "format": "json"},
+        )
+        (cursor,) = parse_qs(urlparse(response.json()["next"]).query)["before"]
+
+        response = self.client.get(
+            reverse("messenger:message-list"),
+            data={"before": cursor, "after": cursor, "format": "json"},
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
 
 class CreateMessageViewTest(PostWithoutTokenMixin, APITestCase):
     url_name = "messenger:message-list"
@@ -53,6 +266,268 @@ class CreateMessageViewTest(PostWithoutTokenMixin, APITestCase):
         )
         self.assertEqual(response.status_code, 201)
 
+    def test_create_message_in_foreign_chat(self):
+        user, chat = UserFactory(), ChatFactory()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {user.auth_token.key}"
+        )
+        response = self.client.post(
+            reverse("messenger:message-list"),
+            data={
+                "sender": user.pk,
+                "chat": chat.pk,
+                "text": "add new hello world",
+                "status": 1,
+            },
+        )
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+    def test_failed_create_writes_no_events(self):
+        chat = ChatFactory()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {chat.creator.auth_token.key}"
+        )
+
+        def send_and_fail(events):
+            send_events(events)
+            raise DatabaseError
+
+        with patch("messenger.signals.send_events", send_and_fail):
+            with self.assertRaises(DatabaseError):
+                self.client.post(
+                    reverse("messenger:message-list"),
+                    data={
+                        "sender": chat.creator.pk,
+                        "chat": chat.pk,
+                        "text": "add new hello world",
+                        "status": 1,
+                    },
+                )
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class BulkCreateMessageViewTest(PostWithoutTokenMixin, APITestCase):
+    url_name = "messenger:message-bulk"
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.chats = ChatFactory.create_batch(size=2, creator=self.user)
+
+    def authenticate(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def get_payload(self, chats, size):
+        return [
+            {
+                "sender": self.user.pk,
+                "chat": chat.pk,
+                "text": f"message {index}",
+                "status": 1,
+            }
+            for chat in chats
+            for index in range(size)
+        ]
+
+    def test_bulk_create_messages(self):
+        self.authenticate()
+        with patch("messenger.api.v1.views.send_events") as send_events:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    reverse(self.url_name),
+                    data=self.get_payload(self.chats, size=10),
+                    format="json",
+                )
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 20)
+        self.assertEqual(Message.objects.count(), 20)
+
+        inserts = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('INSERT INTO "messenger_message"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        (events,), _ = send_events.call_args
+        self.assertEqual(set(events), {str(chat.id) for chat in self.chats})
+        for event in events.values():
+            self.assertEqual(len(event["messages"]), 10)
+
+    def test_bulk_create_messages_in_foreign_chat(self):
+        self.authenticate()
+        foreign_chat = ChatFactory()
+        response = self.client.post(
+            reverse(self.url_name),
+            data=self.get_payload([self.chats[0], foreign_chat], size=1),
+            format="json",
+        )
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+        self.assertFalse(Message.objects.exists())
+
+    def test_bulk_create_too_many_messages(self):
+        self.authenticate()
+        response = self.client.post(
+            reverse(self.url_name),
+            data=self.get_payload(self.chats[:1], size=501),
+            format="json",
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertFalse(Message.objects.exists())
+
+    def test_failed_bulk_create_writes_no_events(self):
+        self.authenticate()
+        with patch(
+            "messenger.api.v1.views.enqueue", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post(
+                    reverse(self.url_name),
+                    data=self.get_payload(self.chats, size=2),
+                    format="json",
+                )
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class ConditionalGetMessageViewTest(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.message = MessageFactory(
+            chat=ChatFactory(creator=self.user), sender=self.user
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def get_message(self, data=None, **headers):
+        return self.client.get(
+            reverse(
+                "messenger:message-detail", kwargs={"pk": self.message.pk}
+            ),
+            data=data,
+            **headers,
+        )
+
+    def test_get_message_not_modified_since(self):
+        # Nested users and chats aren't dated
+        data = {"fields": "id,text,updated_at"}
+        response = self.get_message(data)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+        response = self.get_message(
+            data, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+
+    def test_get_message_with_nested_objects_is_not_dated(self):
+        response = self.get_message()
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_get_message_modified_by_sender(self):
+        etag = self.get_message()["ETag"]
+        self.user.username = "renamed"
+        self.user.save()
+
+        response = self.get_message(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["sender"]["username"], "renamed")
+
+    def test_get_message_modified_by_chat(self):
+        etag = self.get_message()["ETag"]
+        self.message.chat.title = "renamed"
+        self.message.chat.save()
+
+        response = self.get_message(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["chat"]["title"], "renamed")
+
+    def test_get_message_with_invalid_id(self):
+        response = self.client.get(reverse("messenger:message-list") + "abc/")
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    def test_get_message_modified_by_file(self):
+        etag = self.get_message()["ETag"]
+        FileFactory(message=self.message)
+
+        response = self.get_message(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.json()["file_set"]), 1)
+
+
+class SearchMessageViewTest(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.chat = ChatFactory(creator=self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def search(self, **data):
+        return self.client.get(
+            reverse("messenger:message-search"),
+            data={"format": "json", **data},
+        )
+
+    def test_search_message(self):
+        message = MessageFactory(
+            chat=self.chat, sender=self.user, text="Deploying the release"
+        )
+        MessageFactory(chat=self.chat, sender=self.user, text="Lunch?")
+
+        response = self.search(search="deploy rele")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        (result,) = response.json()["results"]
+        self.assertEqual(result["id"], message.pk)
+        self.assertEqual(
+            result["highlight"],
+            "<mark>Deploying</mark> the <mark>release</mark>",
+        )
+
+    def test_search_message_in_own_chats_only(self):
+        MessageFactory(text="secret plans")
+        other_chat = ChatFactory(invited=[self.user])
+        message = MessageFactory(
+            chat=other_chat, sender=other_chat.creator, text="secret plans"
+        )
+
+        response = self.search(search="secret")
+        self.assertListEqual(
+            [result["id"] for result in response.json()["results"]],
+            [message.pk],
+        )
+
+        response = self.search(search="secret", chat=self.chat.pk)
+        self.assertListEqual(response.json()["results"], [])
+
+    def test_search_message_pages(self):
+        with freeze_time("2022-01-01"):
+            messages = MessageFactory.create_batch(
+                size=5, chat=self.chat, sender=self.user, text="hello"
+            )
+
+        response = self.search(search="hello", limit=3)
+        self.assertIsNone(response.json()["previous"])
+        next_page = self.client.get(response.json()["next"])
+        self.assertIsNone(next_page.json()["next"])
+
+        self.assertListEqual(
+            [
+                result["id"]
+                for page in (response, next_page)
+                for result in page.json()["results"]
+            ],
+            [message.pk for message in reversed(messages)],
+        )
+
+    def test_search_message_without_words(self):
+        response = self.search()
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
 
 class DeleteMessageViewTest(DeleteWithoutTokenMixin, APITestCase):
     url_name = "messenger:message-detail"
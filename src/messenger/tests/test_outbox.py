@@ -0,0 +1,160 @@
+import io
+import json
+import uuid
+from unittest.mock import AsyncMock, call, patch
+
+import msgpack
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.test import TestCase
+
+from messenger.models import Message, OutboxEvent
+from messenger.outbox import (
+    OUTBOX_LOCK_KEY,
+    dispatch_outbox,
+    outbox_dispatcher,
+)
+from messenger.tests.factory import ChatFactory, MessageFactory
+from messenger.websocket.batching import insert_messages
+from messenger.websocket.events import send_events
+from messenger.websocket.frames import JSON, MSGPACK, FrameCache, encode_frame
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.chat = ChatFactory()
+        OutboxEvent.objects.all().delete()
+
+        patcher = patch.object(outbox_dispatcher, "wake")
+        self.wake = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.channel_layer = AsyncMock()
+        patcher = patch(
+            "messenger.outbox.get_channel_layer",
+            return_value=self.channel_layer,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_events_are_written_with_the_message(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = MessageFactory(chat=self.chat, sender=self.chat.creator)
+
+        (event,) = OutboxEvent.objects.all()
+        self.assertEqual(event.group, str(self.chat.pk))
+        self.assertEqual(event.event["id"], message.pk)
+        self.assertEqual(event.event["chat"], self.chat.pk)
+        self.wake.assert_called_once_with()
+        self.channel_layer.group_send.assert_not_called()
+
+    def test_rolled_back_events_are_not_sent(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                MessageFactory(chat=self.chat, sender=self.chat.creator)
+                transaction.set_rollback(True)
+
+        self.assertListEqual(callbacks, [])
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.wake.assert_not_called()
+
+    def test_dispatch_keeps_order_of_every_group(self):
+        for index in range(3):
+            send_events(
+                {"first": {"index": index}, "second": {"index": index}}
+            )
+
+        self.assertEqual(dispatch_outbox(), 6)
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        for group in ("first", "second"):
+            self.assertListEqual(
+                [
+                    sent
+                    for sent in self.channel_layer.group_send.call_args_list
+                    if sent.args[0] == group
+                ],
+                [call(group, {"index": index}) for index in range(3)],
+            )
+
+    def test_failed_batch_writes_no_events(self):
+        message = Message(
+            chat=self.chat,
+            sender=self.chat.creator,
+            text="hi",
+            client_id=uuid.uuid4(),
+        )
+
+        with patch(
+            "messenger.websocket.batching.enqueue", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                insert_messages([message])
+
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_dispatch_skips_groups_of_other_dispatchers(self):
+        send_events({"first": {"index": 0}, "second": {"index": 0}})
+        send_events({"first": {"index": 1}})
+        other = connections.create_connection("default")
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_lock(%s, hashtext(%s))",
+                [OUTBOX_LOCK_KEY, "first"],
+            )
+
+        self.assertEqual(dispatch_outbox(), 1)
+        self.channel_layer.group_send.assert_called_once_with(
+            "second", {"index": 0}
+        )
+
+        other.close()
+        self.assertEqual(dispatch_outbox(), 2)
+        self.assertListEqual(
+            self.channel_layer.group_send.call_args_list[1:],
+            [call("first", {"index": index}) for index in range(2)],
+        )
+
+    def test_failed_events_stay_in_outbox(self):
+        send_events({"first": {"index": 0}})
+        self.channel_layer.group_send.side_effect = OSError
+
+        with self.assertRaises(OSError):
+            dispatch_outbox()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_dispatch_command(self):
+        send_events({"first": {"index": 0}, "second": {"index": 0}})
+        stdout = io.StringIO()
+
+        call_command("dispatch_outbox", once=True, stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), "Sent 2 events\n")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_chat_events_are_encoded_once_per_protocol(self):
+        event = {"type": "send_json", "id": 1, "text": "hi"}
+        send_events({"first": event})
+
+        dispatch_outbox()
+
+        ((group, sent),) = [
+            sent.args for sent in self.channel_layer.group_send.call_args_list
+        ]
+        self.assertEqual(sent["type"], "send.encoded")
+        self.assertEqual(sent["content"], event)
+
+        cache = FrameCache()
+        with patch(
+            "messenger.websocket.frames.encode_frame", wraps=encode_frame
+        ) as encode:
+            frames = [
+                cache.get(sent["key"], sent["content"], protocol)
+                for protocol in (JSON, MSGPACK, JSON, MSGPACK)
+            ]
+        self.assertEqual(encode.call_count, 2)
+        self.assertEqual(json.loads(frames[0]), event)
+        self.assertEqual(msgpack.unpackb(frames[1]), event)
+        self.assertListEqual(frames[2:], frames[:2])
@@ -0,0 +1,91 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from messenger.models import File, Message
+from messenger.tests.factory import ChatFactory, UserFactory
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN checks need Postgres")
+class QueryPlanTest(APITestCase):
+    """
+    Fail when queries of the list endpoints regress to sequential scans
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory()
+        cls.chat = ChatFactory(creator=cls.user)
+        chats = [cls.chat]
+        chats += ChatFactory.create_batch(size=3, invited=[cls.user])
+        chats += ChatFactory.create_batch(size=3)
+
+        messages = Message.objects.bulk_create(
+            Message(chat=chat, sender=chat.creator, text=f"message {index}")
+            for chat in chats
+            for index in range(200)
+        )
+        File.objects.bulk_create(
+            File(message=message, document="file/test.png")
+            for message in messages[::10]
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.user.auth_token.key}"
+        )
+
+    def assert_no_seq_scans(self, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data={"format": "json", **data})
+        self.assertEqual(response.status_code, 200)
+
+        queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT")
+            and "messenger_" in query["sql"]
+        ]
+        self.assertTrue(queries)
+
+        with connection.cursor() as cursor:
+            # Tables of the tests are tiny, so make the planner prefer
+            # any usable index over a sequential scan
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            for sql in queries:
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                self.assertNotRegex(plan, r"Seq Scan on messenger_", sql)
+
+    def test_chat_list_plan(self):
+        self.assert_no_seq_scans(reverse("messenger:chat-list"), {})
+
+    def test_message_list_plan(self):
+        self.assert_no_seq_scans(
+            reverse("messenger:message-list"), {"chat": self.chat.id}
+        )
+
+    def test_file_list_plan(self):
+        self.assert_no_seq_scans(
+            reverse("messenger:file-list"),
+            {"message": File.objects.first().message_id},
+        )
+
+    def test_chat_inbox_plan(self):
+        self.assert_no_seq_scans(reverse("messenger:chat-inbox"), {})
+
+    def test_chat_search_plan(self):
+        self.assert_no_seq_scans(
+            reverse("messenger:chat_search-list"), {"search": "python"}
+        )
+
+    def test_message_search_plan(self):
+        self.assert_no_seq_scans(
+            reverse("messenger:message-search"), {"search": "message"}
+        )
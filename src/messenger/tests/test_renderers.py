@@ -0,0 +1,71 @@
+import datetime
+import io
+from decimal import Decimal
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from messenger.tests.factory import MessageFactory
+from server.parsers import OrjsonParser
+from server.renderers import OrjsonRenderer, orjson
+
+
+@skipIf(orjson is None, "orjson isn't installed")
+class OrjsonRendererTest(SimpleTestCase):
+    data = {
+        "id": 1,
+        "status": _("Sent"),
+        "price": Decimal("1.50"),
+        "created_at": datetime.datetime(2022, 1, 1, tzinfo=timezone.utc),
+        "date": datetime.date(2022, 1, 1),
+        "text": "line\u2028separator, юнікод",
+        "users": {1: {"id": 1}},
+        "results": [None, True, 1.5],
+    }
+
+    def test_output_matches_stdlib_renderer(self):
+        self.assertEqual(
+            OrjsonRenderer().render(self.data),
+            JSONRenderer().render(self.data),
+        )
+
+    def test_indented_output_falls_back(self):
+        self.assertEqual(
+            OrjsonRenderer().render(self.data, "application/json; indent=4"),
+            JSONRenderer().render(self.data, "application/json; indent=4"),
+        )
+
+    def test_without_orjson(self):
+        with patch("server.renderers.orjson", None):
+            self.assertEqual(
+                OrjsonRenderer().render(self.data),
+                JSONRenderer().render(self.data),
+            )
+
+    def test_parser_matches_stdlib_parser(self):
+        body = JSONRenderer().render(self.data)
+        self.assertEqual(
+            OrjsonParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body)),
+        )
+
+    def test_parse_error(self):
+        with self.assertRaises(ParseError):
+            OrjsonParser().parse(io.BytesIO(b"{"))
+
+
+class BenchmarkJsonTest(TestCase):
+    def test_benchmark(self):
+        MessageFactory.create_batch(size=3)
+
+        stdout = io.StringIO()
+        call_command("benchmark_json", repeat=2, stdout=stdout)
+        self.assertIn("render:", stdout.getvalue())
+        self.assertIn("parse:", stdout.getvalue())
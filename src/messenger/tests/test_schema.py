@@ -0,0 +1,70 @@
+import io
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+
+from server.schema import load_schema
+
+
+class SchemaViewTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(SCHEMA_ROOT=Path(directory.name))
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        load_schema.cache_clear()
+        self.addCleanup(load_schema.cache_clear)
+
+    def get_schema(self, extension=".json", **headers):
+        return self.client.get(
+            reverse("schema-json", kwargs={"extension": extension}), **headers
+        )
+
+    def test_schema_is_generated_once(self):
+        with patch(
+            "server.schema.generate_schema", return_value=b"{}"
+        ) as generate_schema:
+            for _ in range(2):
+                response = self.get_schema()
+                self.assertEqual(response.status_code, HTTP_200_OK)
+
+        generate_schema.assert_called_once_with(".json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age", response["Cache-Control"])
+
+    def test_not_modified(self):
+        etag = self.get_schema(".yaml")["ETag"]
+
+        response = self.get_schema(".yaml", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_generated_file_is_served(self):
+        call_command("generate_schema", stdout=io.StringIO())
+
+        with patch("server.schema.generate_schema") as generate_schema:
+            response = self.get_schema()
+        generate_schema.assert_not_called()
+        schema = response.json()
+        self.assertNotIn("host", schema)
+        # Serializers picked by the request method are introspected
+        self.assertIn(
+            "schema", schema["paths"]["/chat"]["get"]["responses"]["200"]
+        )
+        self.assertIn(
+            "chat",
+            [
+                parameter["name"]
+                for parameter in schema["paths"]["/message"]["get"][
+                    "parameters"
+                ]
+            ],
+        )
@@ -0,0 +1,165 @@
+import asyncio
+
+from channels.db import database_sync_to_async
+from django.db import IntegrityError, transaction
+
+from messenger.indexing import enqueue
+from messenger.models import Chat, Message
+from messenger.websocket.events import get_messages_events, send_events
+
+
+class MessageRejected(Exception):
+    """
+    The message can't be saved, `errors` are sent back to the client
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def insert_messages(messages):
+    """Insert the messages which aren't saved yet with one statement
+
+    Args:
+        messages: unsaved message instances with `client_id`
+
+    Returns:
+        tuple: saved messages in the order of the given ones and the ones
+         which have been inserted
+    """
+    keys = [(message.sender_id, message.client_id) for message in messages]
+    saved = {
+        (message.sender_id, message.client_id): message
+        for message in Message.objects.filter(
+            sender__in={sender_id for sender_id, _ in keys},
+            client_id__in={client_id for _, client_id in keys},
+        )
+    }
+    created = []
+    for key, message in zip(keys, messages):
+        if key not in saved:
+            saved[key] = message
+            created.append(message)
+
+    with transaction.atomic():
+        Message.objects.bulk_create(created)
+        # Written with the messages, so a rolled back batch sends nothing
+        send_events(get_messages_events(created))
+        # Bulk inserts don't send the signals which queue the indexing
+        enqueue(Message, [message.pk for message in created])
+    return [saved[key] for key in keys], created
+
+
+def save_messages(messages):
+    """Insert the messages sent over the websockets with one statement
+
+    Messages already saved with the same sender and `client_id` are
+    returned instead of inserted again, messages to deleted chats are
+    rejected. When the insert fails, e.g. a chat is deleted or a resent
+    message is inserted by another batch at the same time, the messages
+    are inserted one by one, so only the failed ones are rejected.
+
+    Args:
+        messages: unsaved message instances with `client_id`
+
+    Returns:
+        list: saved messages or `MessageRejected` in the order of the
+         given ones
+    """
+    chat_ids = set(
+        Chat.objects.filter(
+            id__in={message.chat_id for message in messages}
+        ).values_list("id", flat=True)
+    )
+    results = [
+        None
+        if message.chat_id in chat_ids
+        else MessageRejected({"chat": ["Chat does not exist."]})
+        for message in messages
+    ]
+    pending = [
+        (index, message)
+        for index, message in enumerate(messages)
+        if results[index] is None
+    ]
+
+    try:
+        saved, _ = insert_messages([message for _, message in pending])
+    except IntegrityError:
+        saved = []
+        for _, message in pending:
+            # The batch has been rolled back, so it's inserted anew
+            message.pk = None
+            try:
+                (row,), _ = insert_messages([message])
+            except IntegrityError:
+                row = MessageRejected(
+                    {"non_field_errors": ["Message could not be saved."]}
+                )
+            saved.append(row)
+
+    for (index, _), result in zip(pending, saved):
+        results[index] = result
+
+    return results
+
+
+class MessageBatcher:
+    """
+    Saves messages sent over the websockets of the process in batches
+
+    The first message waits `delay` seconds for others to join its batch,
+    messages which come while a batch is being saved form the next one,
+    so the busier the process, the larger its inserts.
+    """
+
+    delay = 0.005
+    max_size = 500
+
+    def __init__(self):
+        self.pending = []
+        self.task = None
+
+    async def save(self, message):
+        """Save the message with the next batch
+
+        Args:
+            message: unsaved message instance
+
+        Returns:
+            Message: saved message
+
+        Raises:
+            MessageRejected: the message can't be saved
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.flush())
+        return await future
+
+    async def flush(self):
+        try:
+            await asyncio.sleep(self.delay)
+            while self.pending:
+                batch = self.pending[: self.max_size]
+                del self.pending[: self.max_size]
+                try:
+                    saved = await database_sync_to_async(save_messages)(
+                        [message for message, _ in batch]
+                    )
+                except Exception as exc:  # pylint: disable=broad-except
+                    for _, future in batch:
+                        future.set_exception(exc)
+                else:
+                    for (_, future), result in zip(batch, saved):
+                        if isinstance(result, MessageRejected):
+                            future.set_exception(result)
+                        else:
+                            future.set_result(result)
+        finally:
+            self.task = None
+
+
+message_batcher = MessageBatcher()
@@ -1,7 +1,163 @@
+import asyncio
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.db import DatabaseError
+
+from messenger.api.v1.serializers import MessageSendSerializer
+from messenger.cache import membership_cache
+from messenger.models import Message
+from messenger.websocket.batching import MessageRejected, message_batcher
+from messenger.websocket.events import get_user_group
+from messenger.websocket.frames import (
+    JSON,
+    FrameError,
+    decode_frame,
+    encode_frame,
+    frame_cache,
+    select_protocol,
+)
+
+# Close codes of the rejected connections, mirroring HTTP statuses
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+
+@database_sync_to_async
+def get_chat_ids(user):
+    return membership_cache.get_chat_ids(user.id)
 
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+@database_sync_to_async
+def load_chat_ids(user):
+    # Local copies of the cache in this process may still be stale
+    return membership_cache.load(user.id)
+
+
+class FrameFormatMixin:
+    """
+    Mixin to speak the frame format negotiated by the subprotocol
+
+    Clients pick MessagePack and/or compression of large frames with
+    `Sec-WebSocket-Protocol`, see `messenger.websocket.frames`. Group
+    events are encoded once per broadcast and format, by the first
+    connection of the process which sends them in that format.
+    """
+
+    protocol = JSON
+
+    async def accept(self, subprotocol=None):
+        subprotocol = select_protocol(self.scope.get("subprotocols", ()))
+        self.protocol = subprotocol or JSON
+        await super().accept(subprotocol)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        try:
+            content = decode_frame(
+                text_data if text_data is not None else bytes_data,
+                self.protocol,
+            )
+        except FrameError:
+            await self.send_json({"type": "error", "detail": "Invalid frame"})
+            return
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content, close=False):
+        await self.send_frame(encode_frame(content, self.protocol), close)
+
+    async def send_frame(self, frame, close=False):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame, close=close)
+        else:
+            await self.send(text_data=frame, close=close)
+
+    async def send_encoded(self, event):
+        """Send the frame of the connection's format from a group event
+
+        Args:
+            event: Event with the content and the key of the broadcast
+        """
+        await self.send_frame(
+            frame_cache.get(event["key"], event["content"], self.protocol)
+        )
+
+
+class MessageSendMixin:
+    """
+    Mixin to create messages sent over the websocket
+
+    `{"type": "message.send", "client_id": <uuid>, "chat": <id>, "text":
+    <text>}` is answered with `message.ack` carrying the id of the saved
+    message, or `message.error` with the validation errors. A message
+    resent with the same `client_id` is acknowledged, not saved twice.
+    Messages are inserted in batches with the ones of other connections.
+    """
+
+    default_chat_id = None
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict) or (
+            content.get("type") != "message.send"
+        ):
+            await self.send_json({"type": "error", "detail": "Unknown type"})
+            return
+
+        serializer = MessageSendSerializer(
+            data={"chat": self.default_chat_id, **content}
+        )
+        if not serializer.is_valid():
+            await self.send_message_error(content, serializer.errors)
+            return
+
+        data = serializer.validated_data
+        if data["chat"] not in await self.get_chat_ids():
+            await self.send_message_error(
+                content, {"chat": ["You are not a member of this chat."]}
+            )
+            return
+
+        try:
+            message = await message_batcher.save(
+                Message(
+                    sender_id=self.scope["user"].id,
+                    chat_id=data["chat"],
+                    text=data["text"],
+                    client_id=data["client_id"],
+                )
+            )
+        except MessageRejected as exc:
+            await self.send_message_error(content, exc.errors)
+            return
+        except DatabaseError:
+            # The client may send it again with the same `client_id`
+            await self.send_message_error(
+                content, {"non_field_errors": ["Message could not be saved."]}
+            )
+            return
+
+        await self.send_json(
+            {
+                "type": "message.ack",
+                "client_id": str(message.client_id),
+                "id": message.id,
+                "chat": message.chat_id,
+                "created_at": message.created_at.isoformat(),
+            }
+        )
+
+    async def send_message_error(self, content, errors):
+        await self.send_json(
+            {
+                "type": "message.error",
+                "client_id": content.get("client_id"),
+                "errors": errors,
+            }
+        )
+
+
+class ChatConsumer(
+    FrameFormatMixin, MessageSendMixin, AsyncJsonWebsocketConsumer
+):
     """
     Chat consumer
     """
@@ -9,14 +165,49 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.chat_id = None
+        self.chat_ids = None
+        self.user_group = None
+
+    @property
+    def default_chat_id(self):
+        return self.chat_id
+
+    async def get_chat_ids(self):
+        """Ids of the user's chats, looked up once per connection
+
+        They're reloaded when the user's group gets `chats.changed`.
+
+        Returns:
+            frozenset: chat ids
+        """
+        if self.chat_ids is None:
+            self.chat_ids = await get_chat_ids(self.scope["user"])
+        return self.chat_ids
 
     async def connect(self):
         """
-        Connect to room
+        Connect to room when the user is a member of the chat
+
+        Anonymous users are rejected with `4401` close code and users
+        who aren't members of the chat with `4403`, before the connection
+        is accepted. The user's group tells when the user leaves the chat.
         """
-        self.chat_id = self.scope["url_route"]["kwargs"]["chat_id"]
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+
+        chat_id = self.scope["url_route"]["kwargs"]["chat_id"]
+        if int(chat_id) not in await self.get_chat_ids():
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
 
-        await self.channel_layer.group_add(self.chat_id, self.channel_name)
+        self.chat_id = chat_id
+        self.user_group = get_user_group(user.id)
+        await asyncio.gather(
+            self.channel_layer.group_add(self.chat_id, self.channel_name),
+            self.channel_layer.group_add(self.user_group, self.channel_name),
+        )
         await self.accept()
 
     async def disconnect(self, code):
@@ -25,7 +216,25 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         Args:
             code: Code of disconnect
         """
-        await self.channel_layer.group_discard(self.chat_id, self.channel_name)
+        if self.chat_id is not None:
+            await asyncio.gather(
+                self.channel_layer.group_discard(
+                    self.chat_id, self.channel_name
+                ),
+                self.channel_layer.group_discard(
+                    self.user_group, self.channel_name
+                ),
+            )
+
+    async def chats_changed(self, event):
+        """Close the connection when the user has left the chat
+
+        Args:
+            event: Event from the user's group
+        """
+        self.chat_ids = await load_chat_ids(self.scope["user"])
+        if int(self.chat_id) not in self.chat_ids:
+            await self.close(code=CLOSE_FORBIDDEN)
 
     async def send_message(self, response):
         """Receive message from room group
@@ -34,3 +243,92 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             response: Message from room group
         """
         await self.send_json(response)
+
+
+class UserConsumer(
+    FrameFormatMixin, MessageSendMixin, AsyncJsonWebsocketConsumer
+):
+    """
+    Consumer of all chats of the user over a single connection
+
+    The channel is added to the groups of every chat of the user, events
+    carry the id of their chat. When the user joins or leaves chats, the
+    user's group gets `chats.changed` and the subscriptions are updated.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_group = None
+        self.chat_ids = frozenset()
+
+    async def get_chat_ids(self):
+        return self.chat_ids
+
+    async def connect(self):
+        """
+        Subscribe to the user's chats, anonymous users are rejected
+        """
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+
+        self.user_group = get_user_group(user.id)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await self.update_chats(await get_chat_ids(user))
+        await self.accept()
+
+    async def disconnect(self, code):
+        """Leave the groups of the user and the chats
+
+        Args:
+            code: Code of disconnect
+        """
+        if self.user_group is not None:
+            await self.channel_layer.group_discard(
+                self.user_group, self.channel_name
+            )
+        await self.update_chats(frozenset())
+
+    async def update_chats(self, chat_ids):
+        """Join the groups of the new chats and leave the ones of the left
+
+        Args:
+            chat_ids: ids of the current chats of the user
+
+        Returns:
+            tuple: ids of the joined and the left chats
+        """
+        joined, left = chat_ids - self.chat_ids, self.chat_ids - chat_ids
+        self.chat_ids = chat_ids
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_add(str(chat_id), self.channel_name)
+                for chat_id in joined
+            ),
+            *(
+                self.channel_layer.group_discard(
+                    str(chat_id), self.channel_name
+                )
+                for chat_id in left
+            ),
+        )
+        return joined, left
+
+    async def chats_changed(self, event):
+        """Follow the chats the user joined or left
+
+        Args:
+            event: Event from the user's group
+        """
+        joined, left = await self.update_chats(
+            await load_chat_ids(self.scope["user"])
+        )
+        if joined or left:
+            await self.send_json(
+                {
+                    "type": "chats",
+                    "joined": sorted(joined),
+                    "left": sorted(left),
+                }
+            )
@@ -0,0 +1,92 @@
+from django.apps import apps
+from django.db import transaction
+
+from messenger.outbox import outbox_dispatcher
+
+
+def get_user_group(user_id):
+    return f"user.{user_id}"
+
+
+def get_message_data(message, created):
+    return {
+        "text": message.text,
+        "created": created,
+        "id": message.id,
+    }
+
+
+def get_message_event(message, created):
+    """Event of the chat group about a saved message
+
+    Args:
+        message: message instance
+        created: boolean
+
+    Returns:
+        dict: event for the channel layer
+    """
+    return {
+        "type": "send_json",
+        "chat": message.chat_id,
+        **get_message_data(message, created),
+    }
+
+
+def get_messages_events(messages):
+    """One event per chat with all messages created in it
+
+    Args:
+        messages: created message instances
+
+    Returns:
+        dict: events for the channel layer by group name
+    """
+    events = {}
+    for message in messages:
+        event = events.setdefault(
+            str(message.chat_id),
+            {
+                "type": "send_json",
+                "chat": message.chat_id,
+                "created": True,
+                "messages": [],
+            },
+        )
+        event["messages"].append(get_message_data(message, created=True))
+    return events
+
+
+def get_memberships_events(user_ids):
+    """Events of the users' groups telling their chats have changed
+
+    Args:
+        user_ids: ids of the users who joined or left chats
+
+    Returns:
+        dict: events for the channel layer by group name
+    """
+    return {
+        get_user_group(user_id): {"type": "chats.changed"}
+        for user_id in user_ids
+    }
+
+
+def send_events(events):
+    """Write events for the chat groups to the outbox
+
+    They are sent once the surrounding transaction is committed, and
+    never if it's rolled back.
+
+    Args:
+        events: events for the channel layer by group name
+    """
+    if not events:
+        return
+
+    outbox_event = apps.get_model("messenger", "OutboxEvent")
+    outbox_event.objects.bulk_create(
+        outbox_event(group=group, event=event)
+        for group, event in events.items()
+    )
+    transaction.on_commit(outbox_dispatcher.wake)
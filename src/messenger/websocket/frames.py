@@ -0,0 +1,131 @@
+import json
+import zlib
+from collections import OrderedDict
+
+import msgpack
+
+# Subprotocols a client may ask for, a connection without one gets JSON
+JSON = "symfall.json"
+JSON_DEFLATE = "symfall.json.deflate"
+MSGPACK = "symfall.msgpack"
+MSGPACK_DEFLATE = "symfall.msgpack.deflate"
+PROTOCOLS = (JSON, JSON_DEFLATE, MSGPACK, MSGPACK_DEFLATE)
+
+# Smaller frames don't get much smaller when compressed
+COMPRESS_MIN_SIZE = 1024
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+class FrameError(ValueError):
+    pass
+
+
+def select_protocol(subprotocols):
+    """Pick the first of the client's subprotocols the server speaks
+
+    Args:
+        subprotocols: subprotocols requested by the client
+
+    Returns:
+        str: subprotocol or None when none is supported
+    """
+    for subprotocol in subprotocols:
+        if subprotocol in PROTOCOLS:
+            return subprotocol
+    return None
+
+
+def encode_frame(content, protocol):
+    """Encode the content as a frame of the protocol
+
+    Frames of the deflate protocols larger than `COMPRESS_MIN_SIZE` are
+    sent as zlib streams. Contents are always maps, so the compressed
+    frames are told apart by the `0x78` header byte of zlib.
+
+    Args:
+        content: JSON serializable map
+        protocol: subprotocol of the connection
+
+    Returns:
+        str or bytes: text or binary frame
+    """
+    if protocol in (MSGPACK, MSGPACK_DEFLATE):
+        frame = msgpack.packb(content, use_bin_type=True)
+    else:
+        frame = json.dumps(content)
+
+    if protocol in (JSON_DEFLATE, MSGPACK_DEFLATE) and (
+        len(frame) >= COMPRESS_MIN_SIZE
+    ):
+        if isinstance(frame, str):
+            frame = frame.encode()
+        return zlib.compress(frame)
+    return frame
+
+
+class FrameCache:
+    """
+    Frames of the group events encoded by the connections of the process
+
+    A group event reaches every connection of the process in the group,
+    the first connection of a protocol encodes it and the others reuse the
+    frame, so a broadcast is encoded at most once per protocol in use.
+    """
+
+    def __init__(self, max_size=256):
+        self.frames = OrderedDict()
+        self.max_size = max_size
+
+    def get(self, key, content, protocol):
+        """Get the frame of the event, encoding it on the first request
+
+        Args:
+            key: unique key of the event
+            content: JSON serializable map
+            protocol: subprotocol of the connection
+
+        Returns:
+            str or bytes: text or binary frame
+        """
+        cache_key = (key, protocol)
+        frame = self.frames.get(cache_key)
+        if frame is None:
+            frame = encode_frame(content, protocol)
+            self.frames[cache_key] = frame
+            if len(self.frames) > self.max_size:
+                self.frames.popitem(last=False)
+        else:
+            self.frames.move_to_end(cache_key)
+        return frame
+
+
+frame_cache = FrameCache()
+
+
+def decode_frame(frame, protocol):
+    """Decode a frame received from the client
+
+    Text frames are always JSON, binary ones are in the format of the
+    protocol and may be compressed like the frames sent by the server.
+
+    Args:
+        frame: text or binary frame
+        protocol: subprotocol of the connection
+
+    Returns:
+        object: decoded content
+
+    Raises:
+        FrameError: If the frame can't be decoded
+    """
+    try:
+        if isinstance(frame, bytes) and frame[:1] == b"\x78":
+            decompressor = zlib.decompressobj()
+            frame = decompressor.decompress(frame, MAX_FRAME_SIZE)
+            if decompressor.unconsumed_tail:
+                raise FrameError("Frame is too large")
+        if isinstance(frame, bytes) and protocol in (MSGPACK, MSGPACK_DEFLATE):
+            return msgpack.unpackb(frame, raw=False)
+        return json.loads(frame)
+    except (ValueError, zlib.error, msgpack.UnpackException) as exc:
+        raise FrameError(str(exc)) from exc
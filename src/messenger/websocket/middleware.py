@@ -1,40 +1,35 @@
+from urllib.parse import parse_qs
+
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
-from rest_framework.exceptions import AuthenticationFailed
+
+from authentication.backends import get_token
 
 
 @database_sync_to_async
 def get_user(token_key):
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
+    token = get_token(token_key)
+    if token is None:
         return AnonymousUser()
+    return token.user
 
 
 class TokenAuthMiddleware(BaseMiddleware):
     """
     Token checker for WebSocket connections
+
+    The user of `?token=<key>` is put into the scope, without a valid token
+    it's anonymous and the consumer rejects the connection.
     """
 
     async def __call__(self, scope, receive, send):
-        try:
-            token_key = (
-                dict(
-                    (
-                        x.split("=")
-                        for x in scope["query_string"].decode().split("&")
-                    )
-                )
-            ).get("token", None)
-        except ValueError:
-            token_key = None
+        query = parse_qs(scope["query_string"].decode())
+        token_key = query.get("token", [None])[0]
 
         if token_key:
             scope["user"] = await get_user(token_key)
         else:
-            raise AuthenticationFailed
+            scope["user"] = AnonymousUser()
 
         return await super().__call__(scope, receive, send)
@@ -0,0 +1,541 @@
+import logging
+import math
+import pickle
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+
+import redis
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger(__name__)
+
+
+# Connection pools by Redis URL, shared by the whole process
+redis_pools = {}
+redis_pools_lock = threading.Lock()
+
+
+def get_redis(location, **options):
+    """Redis client of the connection pool of the URL
+
+    Args:
+        location: Redis URL, e.g. `redis://redis:6379/1`
+        options: options of the pool when it's created
+
+    Returns:
+        Redis: client
+    """
+    with redis_pools_lock:
+        pool = redis_pools.get(location)
+        if pool is None:
+            pool = redis_pools[location] = redis.ConnectionPool.from_url(
+                location, **options
+            )
+    return redis.Redis(connection_pool=pool)
+
+
+class RedisCache(BaseCache):
+    """
+    Django cache backend storing pickled values in Redis
+
+    All caches with the same `LOCATION` share one connection pool,
+    `OPTIONS` are passed to the pool, e.g. `max_connections` or
+    `socket_timeout`.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        self.location = server
+        self.pool_options = params.get("OPTIONS", {})
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_redis(self.location, **self.pool_options)
+        return self._client
+
+    def get_expiry(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else max(int(math.ceil(timeout)), 1)
+
+    @staticmethod
+    def dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        return pickle.loads(data)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(
+            self.client.set(
+                key, self.dumps(value), ex=self.get_expiry(timeout), nx=True
+            )
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        data = self.client.get(key)
+        return default if data is None else self.loads(data)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.client.set(key, self.dumps(value), ex=self.get_expiry(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        expiry = self.get_expiry(timeout)
+        if expiry is None:
+            return bool(self.client.persist(key))
+        return bool(self.client.expire(key, expiry))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self.client.delete(key))
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        made_keys = [self.make_key(key, version=version) for key in keys]
+        return {
+            key: self.loads(data)
+            for key, data in zip(keys, self.client.mget(made_keys))
+            if data is not None
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self.get_expiry(timeout)
+        with self.client.pipeline(transaction=False) as pipeline:
+            for key, value in data.items():
+                pipeline.set(
+                    self.make_key(key, version=version),
+                    self.dumps(value),
+                    ex=expiry,
+                )
+            pipeline.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        return bool(self.client.exists(key))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        if not self.client.exists(key):
+            raise ValueError("Key '%s' not found" % key)
+        return self.client.incrby(key, delta)
+
+    def delete_pattern(self, pattern, version=None):
+        """Delete keys matching the glob pattern
+
+        Args:
+            pattern: glob pattern of the keys, without prefix and version
+            version: version of the keys
+        """
+        keys = list(
+            self.client.scan_iter(
+                match=self.make_key(pattern, version=version), count=1000
+            )
+        )
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_pattern("*")
+
+
+class LocalCache:
+    """
+    Thread safe in-process LRU cache with expiring entries
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SharedCache:
+    """
+    Base of the caches kept in a shared Django cache
+
+    `CACHE` option names the Django cache, `TIMEOUT` is the lifetime of
+    the entries.
+    """
+
+    key_prefix = None
+
+    def __init__(self, options):
+        self.options = options
+        self.timeout = options["TIMEOUT"]
+
+    @property
+    def cache(self):
+        return caches[self.options["CACHE"]]
+
+    def make_key(self, ident):
+        return f"{self.key_prefix}:{ident}"
+
+    def clear(self):
+        try:
+            self.cache.delete_pattern(self.make_key("*"))
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+
+
+class TwoLevelCache(SharedCache):
+    """
+    Read-through cache with an in-process LRU in front of the shared cache
+
+    Values are looked up in the local LRU, then in the shared cache and
+    only then loaded by `load`. Deleted entries are dropped from both
+    levels, other processes keep their local copy until `LOCAL_TIMEOUT`
+    expires, so it is kept short.
+
+    When Redis is unavailable every miss of the local level is loaded.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.local = LocalCache(
+            size=options["LOCAL_SIZE"],
+            timeout=options["LOCAL_TIMEOUT"],
+        )
+
+    def get(self, ident):
+        """Cached value, loaded on a miss
+
+        Args:
+            ident: identifier of the value
+
+        Returns:
+            object: value or None when it doesn't exist
+        """
+        key = self.make_key(ident)
+
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        try:
+            value = self.cache.get(key)
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+            return self.load(ident)
+
+        if value is None:
+            value = self.load(ident)
+            if value is None:
+                return None
+            try:
+                self.cache.set(key, value, timeout=self.timeout)
+            except redis.RedisError:
+                logger.warning("Cache %s is unavailable", self.key_prefix)
+
+        self.local.set(key, value)
+        return value
+
+    def delete_many(self, idents):
+        keys = [self.make_key(ident) for ident in idents]
+        if not keys:
+            return
+
+        for key in keys:
+            self.local.delete(key)
+        try:
+            self.cache.delete_many(keys)
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+
+    def clear(self):
+        self.local.clear()
+        super().clear()
+
+    def load(self, ident):
+        """Load the value from the source of truth
+
+        Args:
+            ident: identifier of the value
+
+        Raises:
+            NotImplementedError: must be implemented by the cache
+        """
+        raise NotImplementedError
+
+
+class RenderCache(SharedCache):
+    """
+    Serialized representations of objects
+
+    Failures of Redis are reported as misses, so the objects are rendered
+    again.
+    """
+
+    key_prefix = "render"
+
+    def get_many(self, idents):
+        """Cached representations
+
+        Args:
+            idents: identifiers of the representations
+
+        Returns:
+            dict: found representations by identifier
+        """
+        if not idents:
+            return {}
+
+        keys = {self.make_key(ident): ident for ident in idents}
+        try:
+            found = self.cache.get_many(keys)
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+            return {}
+
+        return {keys[key]: value for key, value in found.items()}
+
+    def set_many(self, representations):
+        if not representations:
+            return
+
+        try:
+            self.cache.set_many(
+                {
+                    self.make_key(ident): representation
+                    for ident, representation in representations.items()
+                },
+                timeout=self.timeout,
+            )
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+
+    def make_version_key(self, ident):
+        return self.make_key(f"version:{ident}")
+
+    def get_versions(self, idents):
+        """Versions of the objects which are versioned by the cache
+
+        Args:
+            idents: identifiers of the objects
+
+        Returns:
+            dict: found versions by identifier
+        """
+        if not idents:
+            return {}
+
+        keys = {self.make_version_key(ident): ident for ident in idents}
+        try:
+            found = self.cache.get_many(keys)
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+            return {}
+
+        return {keys[key]: value for key, value in found.items()}
+
+    def bump_versions(self, idents):
+        """Give the objects new versions, so their entries aren't read
+
+        Versions outlive the entries: once a version expires, entries
+        stored without it have expired as well.
+
+        Args:
+            idents: identifiers of the objects
+        """
+        if not idents:
+            return
+
+        try:
+            self.cache.set_many(
+                {
+                    self.make_version_key(ident): uuid.uuid4().hex
+                    for ident in idents
+                },
+                timeout=2 * self.timeout,
+            )
+        except redis.RedisError:
+            logger.warning("Cache %s is unavailable", self.key_prefix)
+
+
+render_cache = RenderCache(settings.RENDER_CACHE)
+
+# Locks of the keys computed by the threads of this process
+computing_locks = WeakValueDictionary()
+computing_locks_lock = threading.Lock()
+
+
+def get_computing_lock(key):
+    with computing_locks_lock:
+        lock = computing_locks.get(key)
+        if lock is None:
+            lock = computing_locks[key] = threading.Lock()
+        return lock
+
+
+def is_expiring(entry, beta):
+    """Decide whether to recompute a value before it expires
+
+    It's the XFetch rule: the closer the expiry and the slower the value
+    is computed, the more likely a reader recomputes it early, so popular
+    entries are refreshed before all of their readers miss at once.
+
+    Args:
+        entry: tuple of the value, computation time and expiry timestamp
+        beta: eagerness of the early recomputation, 1 is the optimum
+
+    Returns:
+        bool: True when the value has to be recomputed
+    """
+    _, delta, expires_at = entry
+    gap = -delta * beta * math.log(1 - random.random())
+    return time.time() + gap >= expires_at
+
+
+def get_or_compute(
+    key,
+    compute,
+    timeout,
+    beta=1.0,
+    lock_timeout=10,
+    wait_timeout=2,
+    cache_alias="default",
+    local_alias="local",
+):
+    """Cached value, computed by a single caller when it's missing
+
+    Values are read from the local cache, then from the shared one. A
+    missing or expiring value is computed by one caller only: threads of
+    the process queue on the same lock, other processes see the lock key
+    in the shared cache. Meanwhile they get the old value if there is
+    one, otherwise they wait for the new one up to `wait_timeout` and
+    compute it themselves after that. Without the shared cache, values
+    are computed right away.
+
+    Args:
+        key: cache key
+        compute: callable computing the value
+        timeout: lifetime of the value in seconds
+        beta: eagerness of the early recomputation
+        lock_timeout: lifetime of the lock of a crashed caller
+        wait_timeout: how long to wait for the value computed elsewhere
+        cache_alias: name of the shared Django cache
+        local_alias: name of the in-process Django cache
+
+    Returns:
+        object: value
+    """
+    shared, local = caches[cache_alias], caches[local_alias]
+
+    def read():
+        entry = local.get(key)
+        if entry is None:
+            try:
+                entry = shared.get(key)
+            except redis.RedisError:
+                logger.warning("Cache %s is unavailable", cache_alias)
+                return None
+            if entry is not None:
+                local.set(key, entry, timeout=max(entry[2] - time.time(), 0))
+        return entry
+
+    entry = read()
+    if entry is not None and not is_expiring(entry, beta):
+        return entry[0]
+
+    with get_computing_lock(key):
+        fresh = read()
+        if fresh is not None and (entry is None or fresh[2] > entry[2]):
+            return fresh[0]
+
+        lock_key = f"{key}:lock"
+        try:
+            acquired = shared.add(lock_key, True, timeout=lock_timeout)
+        except redis.RedisError:
+            # Nobody can store the value meanwhile, so it's not waited for
+            logger.warning("Cache %s is unavailable", cache_alias)
+            acquired, locked = False, False
+        else:
+            locked = not acquired
+
+        if locked and entry is not None:
+            return entry[0]
+
+        if locked:
+            deadline = time.monotonic() + wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                fresh = read()
+                if fresh is not None:
+                    return fresh[0]
+
+        try:
+            started_at = time.monotonic()
+            value = compute()
+            entry = (
+                value,
+                time.monotonic() - started_at,
+                time.time() + timeout,
+            )
+
+            local.set(key, entry, timeout=timeout)
+            try:
+                shared.set(key, entry, timeout=timeout)
+            except redis.RedisError:
+                logger.warning("Cache %s is unavailable", cache_alias)
+        finally:
+            if acquired:
+                try:
+                    shared.delete(lock_key)
+                except redis.RedisError:
+                    logger.warning("Cache %s is unavailable", cache_alias)
+
+        return value
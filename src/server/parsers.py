@@ -0,0 +1,25 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from server.renderers import OrjsonRenderer, orjson
+
+
+class OrjsonParser(JSONParser):
+    """
+    JSON parser backed by orjson when it's installed
+
+    orjson reads UTF-8 only, bodies in other encodings are parsed by the
+    stdlib parser.
+    """
+
+    renderer_class = OrjsonRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,97 @@
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework.views import APIView
+
+api_info = openapi.Info(
+    title="Symfall API",
+    default_version="v1",
+    description="API of the Symfall messenger",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="valerii.duz@symfall.com"),
+    license=openapi.License(name="MIT License"),
+)
+
+FORMATS = {
+    ".json": (OpenAPICodecJson, "application/json"),
+    ".yaml": (OpenAPICodecYaml, "application/yaml"),
+}
+
+
+def get_schema_path(extension):
+    return settings.SCHEMA_ROOT / f"swagger{extension}"
+
+
+def generate_schema(extension):
+    """Introspect the API and encode its public schema
+
+    Args:
+        extension: extension of the format, `.json` or `.yaml`
+
+    Returns:
+        bytes: encoded schema
+    """
+    # Viewsets pick serializers by the request, so the generator needs one.
+    # Empty url keeps the host out of the schema
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = f"/swagger{extension}"
+    request.META.update(SERVER_NAME="localhost", SERVER_PORT="80")
+    request = APIView().initialize_request(request)
+    generator = OpenAPISchemaGenerator(info=api_info, url="")
+    schema = generator.get_schema(request=request, public=True)
+    codec_class, _ = FORMATS[extension]
+    return codec_class(validators=[]).encode(schema)
+
+
+@lru_cache(maxsize=None)
+def load_schema(extension):
+    """Schema with its ETag, prepared once per process
+
+    The file written by `generate_schema` command on deploy is served when
+    it exists, otherwise the schema is generated by the first request.
+
+    Args:
+        extension: extension of the format, `.json` or `.yaml`
+
+    Returns:
+        tuple: encoded schema and its ETag
+    """
+    try:
+        content = get_schema_path(extension).read_bytes()
+    except FileNotFoundError:
+        content = generate_schema(extension)
+    return content, quote_etag(hashlib.md5(content).hexdigest())
+
+
+@require_safe
+def schema_view(request, extension):
+    """Serve the precomputed schema of the API
+
+    Args:
+        request: Django Request Instance
+        extension: extension of the format, `.json` or `.yaml`
+
+    Returns:
+        response: schema or `304 Not Modified`
+    """
+    content, etag = load_schema(extension)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        _, content_type = FORMATS[extension]
+        response = HttpResponse(content, content_type=content_type)
+
+    response["ETag"] = etag
+    patch_cache_control(
+        response, public=True, max_age=settings.SCHEMA_CACHE_TIMEOUT
+    )
+    return response
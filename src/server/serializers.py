@@ -0,0 +1,307 @@
+from collections import OrderedDict
+
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+from server.cache import render_cache
+
+FIELDS_QUERY_PARAM = "fields"
+EXCLUDE_QUERY_PARAM = "exclude"
+
+
+def get_sparse_fields(request):
+    """Read the sparse fieldset requested by the client
+
+    Args:
+        request: Request instance
+
+    Returns:
+        tuple: names of the requested fields or None when all of them
+         are requested, and names of the excluded fields
+    """
+    query_params = getattr(request, "query_params", {})
+
+    fields = query_params.get(FIELDS_QUERY_PARAM)
+    if fields is not None:
+        fields = {name for name in fields.split(",") if name}
+    exclude = {
+        name
+        for name in query_params.get(EXCLUDE_QUERY_PARAM, "").split(",")
+        if name
+    }
+    return fields, exclude
+
+
+def is_sparse(request):
+    fields, exclude = get_sparse_fields(request)
+    return fields is not None or bool(exclude)
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Serializer mixin to render only the fields requested by the client
+
+    Fields are picked with `?fields=id,text` or dropped with
+    `?exclude=chat`. Only the top level serializer of an output is
+    trimmed, input data is always validated with all fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = False
+
+        request = self.context.get("request")
+        if request is None or hasattr(self, "initial_data"):
+            return
+
+        fields, exclude = get_sparse_fields(request)
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or name in exclude:
+                self.fields.pop(name)
+                self.sparse = True
+
+
+def get_render_cached_child(field):
+    if isinstance(field, RenderCacheSerializerMixin):
+        return field
+    if isinstance(field, serializers.ListSerializer) and isinstance(
+        field.child, RenderCacheSerializerMixin
+    ):
+        return field.child
+    return None
+
+
+def get_nested_render_keys(serializer, instances):
+    """Keys of the cached representations of the nested objects
+
+    Changes of the nested objects don't touch the objects they're rendered
+    in, the keys carry their versions instead. Only the loaded relations
+    of the fields left in the serializer are followed.
+
+    Args:
+        serializer: serializer of the objects
+        instances: objects to render
+
+    Returns:
+        list: keys of the nested objects of every level
+    """
+    keys = []
+    for field in serializer.fields.values():
+        child = get_render_cached_child(field)
+        if child is None:
+            continue
+
+        related = {}
+        for instance in instances:
+            try:
+                value = field.get_attribute(instance)
+            except SkipField:
+                continue
+            if value is None:
+                continue
+            for item in value.all() if field is not child else (value,):
+                related[item.pk] = item
+
+        related = list(related.values())
+        keys += child.get_render_keys(related)
+        keys += get_nested_render_keys(child, related)
+    return keys
+
+
+class RenderCacheListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        instances = list(data.all() if hasattr(data, "all") else data)
+        return self.child.render_many(instances)
+
+
+class RenderCacheSerializerMixin:
+    """
+    Serializer mixin to reuse cached representations of unchanged objects
+
+    `Meta.list_serializer_class` has to be `RenderCacheListSerializer`.
+    Representations are stored in Redis by `render_key_prefix`, the object
+    id and `get_render_version`, which is `updated_at` by default. Objects
+    without it are versioned in the cache and have to get a new version
+    with `bump_render_version` when they're changed.
+
+    Nested serializers with this mixin aren't part of the cached
+    representation, they're rendered from their own entries, so a changed
+    user doesn't invalidate all chats. Entries of all nested objects of
+    a page are fetched with one MGET per serializer.
+    """
+
+    render_key_prefix = None
+    render_fragments_context_key = "render_fragments"
+    render_versions_context_key = "render_versions"
+
+    @classmethod
+    def get_render_version(cls, instance):
+        updated_at = getattr(instance, "updated_at", None)
+        return updated_at.isoformat() if updated_at else None
+
+    @classmethod
+    def get_render_ident(cls, instance):
+        return f"{cls.render_key_prefix}:{instance.pk}"
+
+    @classmethod
+    def bump_render_version(cls, instances):
+        render_cache.bump_versions(
+            [cls.get_render_ident(instance) for instance in instances]
+        )
+
+    def get_render_keys(self, instances):
+        """Keys of the representations of the objects
+
+        Args:
+            instances: objects to render
+
+        Returns:
+            list: keys in the order of the objects
+        """
+        # Shared by all serializers of the response
+        versions = self.context.setdefault(
+            self.render_versions_context_key, {}
+        )
+        idents = [self.get_render_ident(instance) for instance in instances]
+        for ident, instance in zip(idents, instances):
+            version = self.get_render_version(instance)
+            if version is not None:
+                versions[ident] = version
+
+        missing = [ident for ident in idents if ident not in versions]
+        if missing:
+            versions.update(dict.fromkeys(missing, ""))
+            versions.update(render_cache.get_versions(missing))
+
+        return [f"{ident}:{versions[ident]}" for ident in idents]
+
+    @property
+    def render_fragments(self):
+        # Shared by all serializers of the response
+        return self.context.setdefault(self.render_fragments_context_key, {})
+
+    def get_nested_cached_fields(self):
+        nested = OrderedDict()
+        for field in self._readable_fields:
+            child = get_render_cached_child(field)
+            if child is not None:
+                nested[field.field_name] = (field, child)
+        return nested
+
+    def prefetch_fragments(self, instances):
+        """Fetch missing entries of the objects and of their nested objects
+
+        Args:
+            instances: objects to render
+        """
+        fragments = self.render_fragments
+        keys = [
+            key
+            for key in self.get_render_keys(instances)
+            if key not in fragments
+        ]
+        if keys:
+            cached = render_cache.get_many(keys)
+            fragments.update((key, cached.get(key)) for key in keys)
+
+        # Objects of nested fields rendered by the same serializer,
+        # e.g. creator and invited users, are fetched together
+        related = OrderedDict()
+        for field, child in self.get_nested_cached_fields().values():
+            _, objects = related.setdefault(type(child), (child, []))
+            for instance in instances:
+                try:
+                    attribute = field.get_attribute(instance)
+                except SkipField:
+                    continue
+                if attribute is None:
+                    continue
+                if field is child:
+                    objects.append(attribute)
+                else:
+                    objects.extend(
+                        attribute.all()
+                        if hasattr(attribute, "all")
+                        else attribute
+                    )
+
+        for child, objects in related.values():
+            if objects:
+                child.prefetch_fragments(objects)
+
+    def render_fragment(self, instance, nested):
+        fragment = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name in nested:
+                continue
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+
+            check_for_none = (
+                attribute.pk
+                if isinstance(attribute, PKOnlyObject)
+                else attribute
+            )
+            fragment[field.field_name] = (
+                None
+                if check_for_none is None
+                else field.to_representation(attribute)
+            )
+        return fragment
+
+    def render_many(self, instances):
+        """Assemble representations from cached and rendered fragments
+
+        Args:
+            instances: objects to render
+
+        Returns:
+            list: representations of the objects
+        """
+        if getattr(self, "sparse", False):
+            representations = []
+            for instance in instances:
+                representations.append(super().to_representation(instance))
+            return representations
+
+        self.prefetch_fragments(instances)
+        fragments = self.render_fragments
+        nested = self.get_nested_cached_fields()
+
+        keys = self.get_render_keys(instances)
+        rendered = {
+            key: self.render_fragment(instance, nested)
+            for key, instance in zip(keys, instances)
+            if fragments.get(key) is None
+        }
+        render_cache.set_many(rendered)
+        fragments.update(rendered)
+
+        representations = []
+        for key, instance in zip(keys, instances):
+            fragment = fragments[key]
+            representation = OrderedDict()
+            for field in self._readable_fields:
+                name = field.field_name
+                if name not in nested:
+                    if name in fragment:
+                        representation[name] = fragment[name]
+                    continue
+
+                try:
+                    attribute = field.get_attribute(instance)
+                except SkipField:
+                    continue
+                representation[name] = (
+                    None
+                    if attribute is None
+                    else field.to_representation(attribute)
+                )
+            representations.append(representation)
+        return representations
+
+    def to_representation(self, instance):
+        return self.render_many([instance])[0]
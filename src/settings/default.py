@@ -87,6 +87,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.contenttypes",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     #
     "corsheaders",
     #
@@ -103,6 +104,7 @@ INSTALLED_APPS = [
     "drf_yasg",
     #
     "channels",
+    "django_elasticsearch_dsl",
     #
     "messenger",
     "authentication",
@@ -132,18 +134,15 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_SCHEMA_CLASS": "rest_framework.schemas.coreapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "authentication.backends.CachedTokenAuthentication",
         "rest_framework.authentication.BasicAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
-    "DEFAULT_RENDERER_CLASSES": (
-        "rest_framework.renderers.JSONRenderer",
-        "rest_framework.renderers.BrowsableAPIRenderer",
-    ),
+    "DEFAULT_RENDERER_CLASSES": ("server.renderers.OrjsonRenderer",),
     "DEFAULT_PARSER_CLASSES": (
-        "rest_framework.parsers.JSONParser",
+        "server.parsers.OrjsonParser",
         "rest_framework.parsers.FormParser",
         "rest_framework.parsers.MultiPartParser",
         "rest_framework.parsers.FileUploadParser",
@@ -152,9 +151,22 @@ REST_FRAMEWORK = {
     "NamespaceVersioning",
     "PAGE_SIZE": 20,
 }
+if DEBUG:
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] += (
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    )
 SWAGGER_SETTINGS = {
     "USE_SESSION_AUTH": False,
+    # The UIs load the precomputed schema instead of generating their own
+    "SPEC_URL": "/swagger.json",
 }
+REDOC_SETTINGS = {
+    "SPEC_URL": "/swagger.json",
+}
+
+# Schema written by `generate_schema` command on deploy
+SCHEMA_ROOT = BASE_DIR.parent / "schema/"
+SCHEMA_CACHE_TIMEOUT = 5 * 60
 
 FILE_UPLOAD_HANDLERS = [
     "django.core.files.uploadhandler.MemoryFileUploadHandler",
@@ -190,6 +202,45 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "server.cache.RedisCache",
+        "LOCATION": "redis://{}:{}/1".format(
+            os.getenv("CACHE_HOST", "redis"),
+            os.getenv("CACHE_PORT", "6379"),
+        ),
+        "KEY_PREFIX": "symfall",
+        "OPTIONS": {
+            "socket_timeout": 0.5,
+            "socket_connect_timeout": 0.5,
+            "max_connections": int(os.getenv("CACHE_MAX_CONNECTIONS", "50")),
+        },
+    },
+    # Per process, for the values read on every request
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+MEMBERSHIP_CACHE = {
+    "CACHE": "default",
+    "TIMEOUT": 60 * 60,
+    # Local copies aren't invalidated by other processes
+    "LOCAL_SIZE": 10000,
+    "LOCAL_TIMEOUT": 5,
+}
+
+TOKEN_CACHE = {
+    **MEMBERSHIP_CACHE,
+    "TIMEOUT": 15 * 60,
+}
+
+RENDER_CACHE = {
+    "CACHE": "default",
+    "TIMEOUT": 24 * 60 * 60,
+}
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -228,6 +279,31 @@ ELASTICSEARCH_DSL = {
         "hosts": os.getenv("ELASTICSEARCH_HOST", "elasticsearch:9200")
     },
 }
+ELASTICSEARCH_ENABLED = strtobool(os.getenv("ELASTICSEARCH_ENABLED", "False"))
+ELASTICSEARCH_DSL_AUTOSYNC = ELASTICSEARCH_ENABLED
+ELASTICSEARCH_DSL_AUTO_REFRESH = False
+# Changes are indexed by `process_index_queue` command
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = "messenger.indexing.QueuedSignalProcessor"
+
+# Websocket events are sent after the commit by `messenger.outbox`
+OUTBOX = {
+    "BATCH_SIZE": 500,
+    "RETRY_DELAY": 1,
+    "POLL_INTERVAL": 1,
+}
+
+# Kept apart from the caches, which are evicted and cleared
+INDEXING_QUEUE = {
+    "LOCATION": "redis://{}:{}/2".format(
+        os.getenv("CACHE_HOST", "redis"),
+        os.getenv("CACHE_PORT", "6379"),
+    ),
+    "KEY": "indexing-queue",
+    "BATCH_SIZE": 500,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY": 5,
+    "POLL_INTERVAL": 1,
+}
 
 # Password validation
 
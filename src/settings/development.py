@@ -1,3 +1,8 @@
 from .default import *  # noqa
 
 DEBUG = True
+
+REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = (  # noqa
+    "server.renderers.OrjsonRenderer",
+    "rest_framework.renderers.BrowsableAPIRenderer",
+)
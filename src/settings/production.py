@@ -3,5 +3,5 @@ from .default import *  # noqa
 DEBUG = False
 
 REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = (  # noqa
-    "rest_framework.renderers.JSONRenderer",
+    "server.renderers.OrjsonRenderer",
 )
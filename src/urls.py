@@ -4,22 +4,15 @@ Symfall URL Configuration
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import include, path, re_path
-from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
 from authentication.routers import router as authentication
 from messenger.routers import router as messenger
+from server.schema import api_info, schema_view
 
 SchemaView = get_schema_view(
-    openapi.Info(
-        title="Symfall API",
-        default_version="v1",
-        description="API of the Symfall messenger",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="valerii.duz@symfall.com"),
-        license=openapi.License(name="MIT License"),
-    ),
+    api_info,
     public=True,
     permission_classes=(permissions.AllowAny,),
 )
@@ -42,8 +35,8 @@ urlpatterns = [
     path("sentry-debug/", trigger_error),
     path("health_check", include("health_check.urls")),
     re_path(
-        r"^swagger(?P<format>\.json|\.yaml)$",
-        SchemaView.without_ui(cache_timeout=0),
+        r"^swagger(?P<extension>\.json|\.yaml)$",
+        schema_view,
         name="schema-json",
     ),
     path(